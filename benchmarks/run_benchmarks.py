@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+CS Crawler MCP - Benchmarks
+Measures crawl latency and throughput against a local fixture web server, fully offline.
+
+Usage:
+    python benchmarks/run_benchmarks.py --concurrency 1,4,16 --requests 40
+    python benchmarks/run_benchmarks.py --driver stdio --scenarios crawl_static,metadata_fast
+    python benchmarks/run_benchmarks.py --output new.json --compare baseline.json
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Keep benchmark runs out of the user's cache; set before the server module reads it
+os.environ.setdefault("CRAWL4AI_CACHE_DIR", tempfile.mkdtemp(prefix="cs-crawler-bench-"))
+# Every fixture is on 127.0.0.1, so a per-host limit would measure itself rather than the server
+os.environ.setdefault("CRAWL4AI_HOST_CONCURRENCY", "100000")
+
+import server  # noqa: E402
+
+# Scenario name -> (tool, fixture path, extra arguments)
+SCENARIOS: Dict[str, tuple] = {
+    "crawl_static": ("crawl_url", "/static/{i}", {"render": "auto"}),
+    "crawl_static_browser": ("crawl_url", "/static/{i}", {"render": "browser"}),
+    "crawl_js": ("crawl_url", "/js/{i}", {"render": "auto"}),
+    "crawl_slow": ("crawl_url", "/slow/{i}", {"render": "auto"}),
+    "crawl_large": ("crawl_url", "/large/{i}", {"render": "auto", "max_chars": 50000}),
+    "crawl_redirect": ("crawl_url", "/redirect/{i}", {"render": "auto"}),
+    "crawl_mixed": ("crawl_url", "/mixed/{i}", {"render": "auto", "max_chars": 50000}),
+    "metadata_fast": ("get_metadata", "/static/{i}", {"mode": "auto"}),
+    "metadata_browser": ("get_metadata", "/static/{i}", {"mode": "browser"}),
+}
+DEFAULT_SCENARIOS = ["crawl_static", "crawl_js", "crawl_slow", "crawl_large", "crawl_mixed", "crawl_redirect",
+                     "metadata_fast"]
+
+ERROR_PREFIXES = ("Error:", "Failed to crawl", "Exception while", "Unknown tool")
+
+def static_page(index: int, paragraphs: int = 40) -> str:
+    """Server-rendered article with headings, links and images"""
+    body = []
+    for n in range(paragraphs):
+        if n % 8 == 0:
+            body.append(f"<h2>Section {n // 8}</h2>")
+        body.append(
+            f"<p>Paragraph {n} of page {index}. Lorem ipsum dolor sit amet, consectetur "
+            f"adipiscing elit, sed do eiusmod tempor incididunt ut labore et dolore magna "
+            f"aliqua. See <a href='/static/{index + n}'>related page {n}</a>.</p>"
+        )
+    body.append("<img src='/img/hero.png' alt='Hero image'>")
+    return (
+        f"<!DOCTYPE html><html lang='en'><head><title>Static page {index}</title>"
+        f"<meta name='description' content='Fixture page {index}'></head>"
+        f"<body><nav><a href='/'>Home</a></nav><article><h1>Page {index}</h1>"
+        f"{''.join(body)}</article><footer>Fixture footer</footer></body></html>"
+    )
+
+def js_page(index: int) -> str:
+    """Single-page app shell whose content only exists after JavaScript runs"""
+    return (
+        f"<!DOCTYPE html><html lang='en'><head><title>App {index}</title></head>"
+        f"<body><div id='root'></div><noscript>You need to enable JavaScript to run this app.</noscript>"
+        f"<script>setTimeout(function() {{ document.getElementById('root').innerHTML = "
+        f"{json.dumps(static_page(index).split('<body>')[1].split('</body>')[0])}; }}, 50);</script>"
+        f"</body></html>"
+    )
+
+async def start_fixture_server(slow_ms: int, large_mb: float):
+    """Serve static, JS-heavy, slow, large and redirecting pages on localhost"""
+    from aiohttp import web
+
+    paragraphs = max(1, int(large_mb * 1024 * 1024 / 260))
+    large_html = static_page(0, paragraphs=paragraphs)
+
+    async def static(request):
+        return web.Response(text=static_page(int(request.match_info["n"])), content_type="text/html")
+
+    async def js(request):
+        return web.Response(text=js_page(int(request.match_info["n"])), content_type="text/html")
+
+    async def slow(request):
+        await asyncio.sleep(slow_ms / 1000)
+        return web.Response(text=static_page(int(request.match_info["n"])), content_type="text/html")
+
+    async def large(request):
+        return web.Response(text=large_html, content_type="text/html")
+
+    async def mixed(request):
+        # One large page in ten; the rest show how much it holds up small pages
+        index = int(request.match_info["n"])
+        return web.Response(text=large_html if index % 10 == 0 else static_page(index), content_type="text/html")
+
+    async def redirect(request):
+        raise web.HTTPFound(f"/static/{request.match_info['n']}")
+
+    async def image(request):
+        return web.Response(body=b"\x89PNG\r\n\x1a\n" + b"\0" * 2048, content_type="image/png")
+
+    app = web.Application()
+    app.router.add_get("/static/{n}", static)
+    app.router.add_get("/js/{n}", js)
+    app.router.add_get("/slow/{n}", slow)
+    app.router.add_get("/large/{n}", large)
+    app.router.add_get("/mixed/{n}", mixed)
+    app.router.add_get("/redirect/{n}", redirect)
+    app.router.add_get("/img/{name}", image)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://127.0.0.1:{port}"
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+def resource_snapshot(pid: Optional[int] = None) -> Dict[str, Any]:
+    """RSS of a process and its children, plus the number of browser processes"""
+    try:
+        import psutil
+    except ImportError:
+        import resource
+
+        # ru_maxrss is KiB on Linux and bytes on macOS; peak only, no children
+        scale = 1 if sys.platform == "darwin" else 1024
+        return {"rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1e6, 1),
+                "children_rss_mb": None, "browser_processes": None}
+
+    process = psutil.Process(pid)
+    children = process.children(recursive=True)
+    children_rss = 0
+    browsers = 0
+    for child in children:
+        try:
+            children_rss += child.memory_info().rss
+            if "chrom" in child.name().lower() or "headless_shell" in child.name().lower():
+                browsers += 1
+        except psutil.Error:
+            continue
+    return {"rss_mb": round(process.memory_info().rss / 1e6, 1),
+            "children_rss_mb": round(children_rss / 1e6, 1), "browser_processes": browsers}
+
+async def run_load(call: Callable[[str, Dict[str, Any]], Awaitable[str]], base_url: str, scenario: str,
+                   concurrency: int, requests: int, offset: int) -> Dict[str, Any]:
+    """Fire requests for one scenario at a fixed concurrency and collect latencies"""
+    tool, path, extra = SCENARIOS[scenario]
+    limit = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors: List[str] = []
+    response_bytes = 0
+
+    async def one(i: int):
+        nonlocal response_bytes
+        arguments = {"url": base_url + path.format(i=offset + i), "cache_mode": "bypass", **extra}
+        async with limit:
+            started = time.perf_counter()
+            try:
+                text = await call(tool, arguments)
+            except Exception as e:
+                text = f"Exception while benchmarking: {e}"
+            elapsed = time.perf_counter() - started
+        if text.startswith(ERROR_PREFIXES):
+            errors.append(text[:200])
+        else:
+            latencies.append(elapsed)
+            response_bytes += len(text.encode("utf-8"))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    wall = time.perf_counter() - started
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": len(errors),
+        "sample_errors": errors[:3],
+        "wall_seconds": round(wall, 3),
+        "pages_per_second": round(len(latencies) / wall, 2) if wall else None,
+        "latency_ms": {name: (round(value * 1000, 1) if value is not None else None)
+                       for name, value in (("p50", percentile(latencies, 50)),
+                                           ("p95", percentile(latencies, 95)),
+                                           ("p99", percentile(latencies, 99)))},
+        "mean_response_bytes": round(response_bytes / len(latencies)) if latencies else None,
+    }
+
+async def bench_handlers(base_url: str, scenarios: List[str], levels: List[int], requests: int) -> List[Dict[str, Any]]:
+    """Drive the tool handlers in-process"""
+    handlers = {"crawl_url": server.crawl_url_handler, "get_metadata": server.get_metadata_handler}
+
+    async def call(tool: str, arguments: Dict[str, Any]) -> str:
+        return (await handlers[tool](arguments))[0]["text"]
+
+    results = []
+    offset = 0
+    try:
+        for scenario in scenarios:
+            for concurrency in levels:
+                result = await run_load(call, base_url, scenario, concurrency, requests, offset)
+                result.update(driver="handlers", **resource_snapshot())
+                results.append(result)
+                print(summary_line(result), file=sys.stderr)
+                offset += requests
+    finally:
+        await server.cleanup()
+    return results
+
+async def bench_stdio(base_url: str, scenarios: List[str], levels: List[int], requests: int) -> List[Dict[str, Any]]:
+    """Drive a real server.py subprocess over the MCP stdio transport"""
+    from mcp import ClientSession
+    from mcp.client.stdio import StdioServerParameters, stdio_client
+
+    params = StdioServerParameters(command=sys.executable, args=[os.path.join(ROOT, "server.py")],
+                                   env=dict(os.environ))
+    results = []
+    offset = 0
+    started = time.perf_counter()
+    async with stdio_client(params) as (read_stream, write_stream):
+        async with ClientSession(read_stream, write_stream) as session:
+            await session.initialize()
+            initialize_ms = round((time.perf_counter() - started) * 1000, 1)
+            server_pid = find_server_pid()
+
+            async def call(tool: str, arguments: Dict[str, Any]) -> str:
+                response = await session.call_tool(tool, arguments)
+                return response.content[0].text if response.content else ""
+
+            for scenario in scenarios:
+                for concurrency in levels:
+                    result = await run_load(call, base_url, scenario, concurrency, requests, offset)
+                    result.update(driver="stdio", initialize_ms=initialize_ms)
+                    if server_pid:
+                        result.update(resource_snapshot(server_pid))
+                    results.append(result)
+                    print(summary_line(result), file=sys.stderr)
+                    offset += requests
+    return results
+
+def find_server_pid() -> Optional[int]:
+    """PID of the server.py child spawned by the stdio client"""
+    try:
+        import psutil
+    except ImportError:
+        return None
+    for child in psutil.Process().children(recursive=True):
+        try:
+            if any(arg.endswith("server.py") for arg in child.cmdline()):
+                return child.pid
+        except psutil.Error:
+            continue
+    return None
+
+def summary_line(result: Dict[str, Any]) -> str:
+    latency = result["latency_ms"]
+    return (f"{result['driver']:8} {result['scenario']:22} c={result['concurrency']:<3} "
+            f"p50={latency['p50']}ms p95={latency['p95']}ms p99={latency['p99']}ms "
+            f"{result['pages_per_second']} pages/s errors={result['errors']}")
+
+def compare(current: List[Dict[str, Any]], baseline_path: str):
+    """Print p95 and throughput changes against an earlier run"""
+    with open(baseline_path, "r") as f:
+        baseline = {(r["driver"], r["scenario"], r["concurrency"]): r for r in json.load(f)["results"]}
+    print("\nChange vs baseline (p95 latency, pages/s):", file=sys.stderr)
+    for result in current:
+        before = baseline.get((result["driver"], result["scenario"], result["concurrency"]))
+        if not before:
+            continue
+        p95_now, p95_then = result["latency_ms"]["p95"], before["latency_ms"]["p95"]
+        rate_now, rate_then = result["pages_per_second"], before["pages_per_second"]
+        p95_delta = f"{(p95_now - p95_then) / p95_then:+.0%}" if p95_now and p95_then else "n/a"
+        rate_delta = f"{(rate_now - rate_then) / rate_then:+.0%}" if rate_now and rate_then else "n/a"
+        print(f"  {result['driver']:8} {result['scenario']:22} c={result['concurrency']:<3} "
+              f"p95 {p95_delta:>6}  throughput {rate_delta:>6}", file=sys.stderr)
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(unknown)} (choose from {', '.join(SCENARIOS)})")
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    runner, base_url = await start_fixture_server(args.slow_ms, args.large_mb)
+    results: List[Dict[str, Any]] = []
+    try:
+        if args.driver in ("handlers", "both"):
+            results += await bench_handlers(base_url, scenarios, levels, args.requests)
+        if args.driver in ("stdio", "both"):
+            results += await bench_stdio(base_url, scenarios, levels, args.requests)
+    finally:
+        await runner.cleanup()
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {"pool_size": server.POOL_SIZE, "requests": args.requests, "slow_ms": args.slow_ms,
+                     "large_mb": args.large_mb},
+        "results": results,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CS Crawler MCP against a local fixture server")
+    parser.add_argument("--driver", choices=["handlers", "stdio", "both"], default="handlers",
+                        help="call the handlers in-process, through the MCP stdio loop, or both")
+    parser.add_argument("--scenarios", default=",".join(DEFAULT_SCENARIOS),
+                        help=f"comma-separated scenarios: {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=40, help="requests per scenario and level")
+    parser.add_argument("--slow-ms", type=int, default=500, help="response delay of the slow pages")
+    parser.add_argument("--large-mb", type=float, default=5.0, help="size of the large page")
+    parser.add_argument("--output", default="bench_output.json", help="where to write the JSON report")
+    parser.add_argument("--compare", help="earlier JSON report to compare against")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {args.output}", file=sys.stderr)
+    if args.compare:
+        compare(report["results"], args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -4,34 +4,94 @@ CS Crawler MCP
 A Model Context Protocol server that provides web crawling functionality via Crawl4AI.
 """
 
+import argparse
 import asyncio
+import contextvars
+import gc
+import gzip
+import hashlib
+import heapq
+import importlib
 import json
 import logging
 import os
+import random
+import re
+import signal
+import subprocess
 import sys
-from contextlib import contextmanager
-from typing import Any, Dict, List, Optional, Sequence
-from urllib.parse import urlparse
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict, deque
+from contextlib import AsyncExitStack, asynccontextmanager, contextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+from urllib.parse import parse_qsl, urlencode, urljoin, urlparse, urlunparse
 
-# Redirect stdout/stderr to suppress Crawl4AI progress messages
-class StdoutRedirect:
-    def __init__(self):
-        self.original_stdout = sys.stdout
-        self.original_stderr = sys.stderr
-        self.devnull = open(os.devnull, 'w')
-    
-    def __enter__(self):
-        sys.stdout = self.devnull
-        sys.stderr = self.devnull
-        return self
-    
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        if sys.stdout != self.original_stdout:
-            sys.stdout.close()
-        if sys.stderr != self.original_stderr:
-            sys.stderr.close()
-        sys.stdout = self.original_stdout
-        sys.stderr = self.original_stderr
+# Reference point for the startup timings reported by server_stats (module load)
+PROCESS_STARTED = time.perf_counter()
+
+# Shared sink for Crawl4AI progress messages, opened once for the whole process
+_devnull = open(os.devnull, 'w')
+
+# Set inside quiet_output(); asyncio tasks each see their own copy
+_quiet = contextvars.ContextVar("quiet_output", default=False)
+
+class _GuardedStream:
+    """Stand-in for sys.stdout/sys.stderr that drops writes from quiet contexts
+
+    The process-wide streams are swapped exactly once; whether a write is
+    discarded is decided per task from a context variable, so overlapping
+    crawls never undo each other's suppression.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def _target(self):
+        return _devnull if _quiet.get() else self.stream
+
+    def write(self, data):
+        return self._target().write(data)
+
+    def writelines(self, lines):
+        return self._target().writelines(lines)
+
+    def flush(self):
+        return self._target().flush()
+
+    def isatty(self):
+        return False if _quiet.get() else self.stream.isatty()
+
+    def __getattr__(self, name):
+        return getattr(self._target(), name)
+
+def _install_output_guard():
+    """Wrap sys.stdout and sys.stderr in guarded streams (idempotent)"""
+    if not isinstance(sys.stdout, _GuardedStream):
+        sys.stdout = _GuardedStream(sys.stdout)
+    if not isinstance(sys.stderr, _GuardedStream):
+        sys.stderr = _GuardedStream(sys.stderr)
+
+def divert_stray_stdout():
+    """Send any unsuppressed print() output to stderr
+
+    Call this once the MCP stdio transport has captured the real stdout
+    buffer, so nothing else can interleave with the JSON-RPC stream.
+    """
+    _install_output_guard()
+    sys.stdout.stream = sys.stderr.stream
+
+@contextmanager
+def quiet_output():
+    """Suppress Crawl4AI console output for the current task only"""
+    _install_output_guard()
+    token = _quiet.set(True)
+    try:
+        yield
+    finally:
+        _quiet.reset(token)
 
 # Configure logging to file only
 log_file = os.path.join(os.path.dirname(__file__), "cs-crawler-mcp.log")
@@ -42,150 +102,3294 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Global crawler instance
-crawler = None
+def _env_int(name: str, default: int) -> int:
+    """Read an integer setting from the environment"""
+    value = os.environ.get(name)
+    if not value:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        logger.warning(f"Ignoring invalid {name}={value!r}, using {default}")
+        return default
+
+def _env_bool(name: str, default: bool) -> bool:
+    """Read a boolean setting from the environment"""
+    value = os.environ.get(name)
+    if not value:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+# Latency buckets in seconds and response size buckets in characters
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (1e3, 1e4, 1e5, 1e6, 1e7, 1e8)
+
+# Phase durations of the tool call running in the current task
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+class Histogram:
+    """Cumulative-bucket histogram, as in the Prometheus exposition format"""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th quantile"""
+        if not self.count:
+            return None
+        target = q * self.count
+        for bound, count in zip(self.buckets, self.counts):
+            if count >= target:
+                return bound
+        return self.max
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "mean": round(self.sum / self.count, 4) if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "max": round(self.max, 4),
+        }
+
+class ServerStats:
+    """Per-tool call counts, phase latency and response size histograms"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.calls: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.phases: Dict[tuple, Histogram] = {}
+        self.response_chars: Dict[str, Histogram] = {}
+        self.counters: Dict[str, int] = {}
+
+    def count(self, name: str, amount: int = 1):
+        """Increment a named event counter"""
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record_call(self, tool: str, trace: Dict[str, float], response_size: int, error: bool):
+        """Fold one finished tool call into the aggregates"""
+        self.calls[tool] = self.calls.get(tool, 0) + 1
+        if error:
+            self.errors[tool] = self.errors.get(tool, 0) + 1
+        for phase, seconds in trace.items():
+            self.phases.setdefault((tool, phase), Histogram()).observe(seconds)
+        self.response_chars.setdefault(tool, Histogram(SIZE_BUCKETS)).observe(response_size)
+
+    def snapshot(self) -> Dict[str, Any]:
+        tools: Dict[str, Any] = {}
+        for tool, calls in sorted(self.calls.items()):
+            tools[tool] = {
+                "calls": calls,
+                "errors": self.errors.get(tool, 0),
+                "phases_seconds": {phase: histogram.to_dict() for (name, phase), histogram
+                                   in sorted(self.phases.items()) if name == tool},
+                "response_chars": self.response_chars[tool].to_dict(),
+            }
+        return {
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "tools": tools,
+            "counters": dict(sorted(self.counters.items())),
+        }
+
+    def prometheus(self) -> str:
+        """Render the aggregates in the Prometheus text exposition format"""
+        lines = [
+            "# TYPE cs_crawler_uptime_seconds gauge",
+            f"cs_crawler_uptime_seconds {time.time() - self.started_at:.1f}",
+            "# TYPE cs_crawler_tool_calls_total counter",
+        ]
+        lines += [f'cs_crawler_tool_calls_total{{tool="{tool}"}} {n}' for tool, n in sorted(self.calls.items())]
+        lines.append("# TYPE cs_crawler_tool_errors_total counter")
+        lines += [f'cs_crawler_tool_errors_total{{tool="{tool}"}} {self.errors.get(tool, 0)}' for tool in sorted(self.calls)]
+        lines.append("# TYPE cs_crawler_events_total counter")
+        lines += [f'cs_crawler_events_total{{event="{name}"}} {n}' for name, n in sorted(self.counters.items())]
+        series = [("cs_crawler_phase_seconds", f'tool="{tool}",phase="{phase}"', histogram)
+                  for (tool, phase), histogram in sorted(self.phases.items())]
+        series += [("cs_crawler_response_chars", f'tool="{tool}"', histogram)
+                   for tool, histogram in sorted(self.response_chars.items())]
+        declared = set()
+        for metric, labels, histogram in series:
+            if metric not in declared:
+                lines.append(f"# TYPE {metric} histogram")
+                declared.add(metric)
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                lines.append(f'{metric}_bucket{{{labels},le="{bound:g}"}} {count}')
+            lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f"{metric}_sum{{{labels}}} {histogram.sum:g}")
+            lines.append(f"{metric}_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+# Global stats, exposed through the server_stats tool
+stats = ServerStats()
+
+@contextmanager
+def timed(phase: str):
+    """Add the duration of the block to the current tool call's trace"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace = _current_trace.get()
+        if trace is not None:
+            trace[phase] = trace.get(phase, 0.0) + time.perf_counter() - started
+
+@asynccontextmanager
+async def acquire_timed(semaphore: asyncio.Semaphore):
+    """Hold a semaphore, counting the wait for it as queue time"""
+    with timed("queue_wait"):
+        await semaphore.acquire()
+    try:
+        yield
+    finally:
+        semaphore.release()
+
+USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+# Browser pool settings
+POOL_SIZE = _env_int("CRAWL4AI_MAX_CONCURRENT", 4)
+POOL_MAX_USES = _env_int("CRAWL4AI_MAX_USES_PER_BROWSER", 50)
+
+# Watchdog settings; an interval of 0 turns the watchdog off
+WATCHDOG_INTERVAL = _env_int("CRAWL4AI_WATCHDOG_INTERVAL", 30)
+BROWSER_MAX_BYTES = _env_int("CRAWL4AI_BROWSER_MAX_MB", 2048) * 1024 * 1024
+SERVER_MAX_BYTES = _env_int("CRAWL4AI_SERVER_MAX_MB", 1024) * 1024 * 1024
+BROWSER_IDLE_TIMEOUT = _env_int("CRAWL4AI_BROWSER_IDLE_TIMEOUT", 600)
+# Seconds past its own deadline after which a navigation counts as hung
+HUNG_GRACE = 30
+BROWSER_PROCESS_NAMES = ("chrom", "headless_shell")
+
+def process_memory() -> Dict[str, Any]:
+    """RSS of this process, its browser processes and its other children (workers)
+
+    Child processes are only visible with psutil; without it, only this
+    process is measured, from /proc where available.
+    """
+    usage: Dict[str, Any] = {"server_rss": None, "browser_rss": None, "browser_processes": None, "worker_rss": None}
+    try:
+        import psutil
+    except ImportError:
+        try:
+            with open("/proc/self/statm") as f:
+                usage["server_rss"] = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, IndexError):
+            pass
+        return usage
+    
+    process = psutil.Process()
+    usage.update(server_rss=process.memory_info().rss, browser_rss=0, browser_processes=0, worker_rss=0)
+    for child in process.children(recursive=True):
+        try:
+            rss = child.memory_info().rss
+            if any(name in child.name().lower() for name in BROWSER_PROCESS_NAMES):
+                usage["browser_rss"] += rss
+                usage["browser_processes"] += 1
+            else:
+                usage["worker_rss"] += rss
+        except psutil.Error:
+            continue
+    return usage
+
+# Global crawler pool
+crawler_pool = None
+
+class _PoolSlot:
+    """A single leasable crawler in the pool"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.crawler = None
+        self.uses = 0
+        self.broken = False
+        self.leased = False
+        self.idle_since = time.monotonic()
+        # Loop time after which the current lease counts as hung
+        self.deadline: Optional[float] = None
+        # Reason to recycle the crawler when its lease ends
+        self.retire: Optional[str] = None
+
+class CrawlerPool:
+    """Bounded pool of Crawl4AI crawlers leased out to tool calls"""
+
+    def __init__(self, size: int = POOL_SIZE, max_uses: int = POOL_MAX_USES,
+                 config: Optional[Dict[str, Any]] = None):
+        self.size = max(1, size)
+        self.max_uses = max(1, max_uses)
+        self.config = config or {}
+        self.recycled = 0
+        self._slots = [_PoolSlot(i) for i in range(self.size)]
+        # LIFO, so warm crawlers are reused before cold slots are launched
+        self._idle: asyncio.Queue = asyncio.LifoQueue()
+        for slot in self._slots:
+            self._idle.put_nowait(slot)
+        self._warmup: Optional[asyncio.Future] = None
+        self._watchdog: Optional[asyncio.Future] = None
+        self.memory: Dict[str, Any] = {}
+
+    @property
+    def idle_count(self) -> int:
+        """Slots not leased right now, with or without a running browser"""
+        return self._idle.qsize()
+
+    def start_warmup(self, count: int, prepare: Optional[Callable[[], Awaitable[Any]]] = None) -> asyncio.Future:
+        """Launch up to count crawlers in the background, after awaiting prepare if given
+
+        Leases wait for the whole warm-up, prepare included, so a call that
+        arrives while Crawl4AI is still importing does not launch a browser
+        of its own.
+        """
+        self._start_watchdog()
+        if self._warmup is None:
+            self._warmup = asyncio.ensure_future(self._prestart(min(count, self.size), prepare))
+        return self._warmup
+
+    async def _prestart(self, count: int, prepare: Optional[Callable[[], Awaitable[Any]]] = None):
+        if prepare is not None:
+            await prepare()
+        slots = [await self._idle.get() for _ in range(count)]
+        try:
+            # Slots that already hold a crawler keep it
+            cold = [slot for slot in slots if slot.crawler is None]
+            launched = await asyncio.gather(*(_create_crawler(self.config) for _ in cold),
+                                            return_exceptions=True)
+            for slot, crawler_instance in zip(cold, launched):
+                if isinstance(crawler_instance, BaseException):
+                    logger.error(f"Failed to pre-launch crawler {slot.index}: {crawler_instance}")
+                else:
+                    slot.crawler = crawler_instance
+        finally:
+            for slot in slots:
+                self._idle.put_nowait(slot)
+
+    async def ready(self):
+        """Wait for a running warm-up to finish instead of launching more browsers"""
+        if self._warmup is not None and not self._warmup.done():
+            try:
+                await asyncio.shield(self._warmup)
+            except Exception:
+                pass
+
+    @asynccontextmanager
+    async def lease(self, timeout: Optional[float] = None):
+        """Borrow a crawler for one navigation and return it afterwards
+
+        A lease still held HUNG_GRACE seconds after timeout has its browser
+        closed by the watchdog.
+        """
+        self._start_watchdog()
+        with timed("queue_wait"):
+            await self.ready()
+            slot = await self._idle.get()
+        slot.leased = True
+        try:
+            with timed("crawler_acquire"):
+                if slot.crawler is not None:
+                    if slot.retire:
+                        await self._recycle(slot, slot.retire)
+                    elif slot.uses >= self.max_uses:
+                        await self._recycle(slot, f"reached {self.max_uses} navigations")
+                    elif not _crawler_is_healthy(slot.crawler):
+                        await self._recycle(slot, "failed health check")
+                if slot.crawler is None:
+                    slot.crawler = await _create_crawler(self.config)
+            slot.uses += 1
+            if timeout is not None:
+                slot.deadline = asyncio.get_event_loop().time() + timeout + HUNG_GRACE
+            try:
+                yield slot.crawler
+            except Exception:
+                slot.broken = True
+                raise
+        finally:
+            slot.deadline = None
+            if slot.broken:
+                await self._recycle(slot, "crashed during navigation")
+            elif slot.retire and slot.crawler is not None:
+                await self._recycle(slot, slot.retire)
+            slot.leased = False
+            slot.idle_since = time.monotonic()
+            self._idle.put_nowait(slot)
+
+    async def _recycle(self, slot: _PoolSlot, reason: str):
+        """Close a slot's crawler so the next lease starts a fresh one"""
+        logger.info(f"Recycling crawler {slot.index}: {reason}")
+        # Detached before the first await, so a concurrent lease launches a fresh crawler
+        crawler_instance, slot.crawler = slot.crawler, None
+        slot.uses = 0
+        slot.broken = False
+        slot.retire = None
+        self.recycled += 1
+        stats.count("browser_recycles")
+        if crawler_instance is not None:
+            try:
+                await crawler_instance.close()
+            except Exception as e:
+                logger.error(f"Error closing crawler {slot.index}: {e}")
+
+    def _start_watchdog(self):
+        if self._watchdog is None and WATCHDOG_INTERVAL > 0:
+            self._watchdog = asyncio.ensure_future(self._watch())
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(WATCHDOG_INTERVAL)
+            try:
+                await self.check()
+            except Exception as e:
+                logger.error(f"Watchdog check failed: {e}")
+
+    async def check(self):
+        """One watchdog pass: kill hung navigations, retire idle browsers, enforce memory limits"""
+        now = asyncio.get_event_loop().time()
+        for slot in self._slots:
+            if slot.deadline is not None and now > slot.deadline and slot.crawler is not None:
+                # Closing the browser fails the navigation; the lease then recycles the slot
+                logger.warning(f"Crawler {slot.index} is stuck past its deadline, closing its browser")
+                stats.count("watchdog_hung_kills")
+                crawler_instance, slot.crawler = slot.crawler, None
+                slot.broken = True
+                slot.deadline = None
+                try:
+                    await asyncio.wait_for(crawler_instance.close(), 10)
+                except Exception as e:
+                    logger.error(f"Error closing stuck crawler {slot.index}: {e}")
+        
+        if BROWSER_IDLE_TIMEOUT > 0:
+            for slot in self._slots:
+                if (not slot.leased and slot.crawler is not None
+                        and time.monotonic() - slot.idle_since > BROWSER_IDLE_TIMEOUT):
+                    stats.count("watchdog_idle_recycles")
+                    await self._recycle(slot, f"idle for over {BROWSER_IDLE_TIMEOUT} s")
+        
+        loop = asyncio.get_event_loop()
+        self.memory = await loop.run_in_executor(None, process_memory)
+        browser_rss = self.memory.get("browser_rss")
+        if browser_rss is not None and browser_rss > BROWSER_MAX_BYTES:
+            reason = f"browsers use {browser_rss // 2 ** 20} MB, over {BROWSER_MAX_BYTES // 2 ** 20} MB"
+            logger.warning(f"Recycling all crawlers: {reason}")
+            stats.count("watchdog_memory_recycles")
+            for slot in self._slots:
+                if slot.crawler is None:
+                    continue
+                if slot.leased:
+                    slot.retire = reason
+                else:
+                    await self._recycle(slot, reason)
+        server_rss = (self.memory.get("server_rss") or 0) + (self.memory.get("worker_rss") or 0)
+        if server_rss > SERVER_MAX_BYTES:
+            logger.warning(f"Server processes use {server_rss // 2 ** 20} MB, over {SERVER_MAX_BYTES // 2 ** 20} MB; "
+                           f"dropping recent pages and restarting worker processes")
+            stats.count("watchdog_memory_trims")
+            trim_memory()
+
+    async def close(self):
+        """Close every crawler owned by the pool"""
+        if self._watchdog is not None:
+            self._watchdog.cancel()
+            self._watchdog = None
+        if self._warmup is not None and not self._warmup.done():
+            self._warmup.cancel()
+            try:
+                await self._warmup
+            except BaseException:
+                pass
+        for slot in self._slots:
+            if slot.crawler is not None:
+                try:
+                    await slot.crawler.close()
+                except Exception as e:
+                    logger.error(f"Error closing crawler {slot.index}: {e}")
+                slot.crawler = None
+        logger.info("Crawler pool closed")
+
+def _crawler_is_healthy(crawler_instance) -> bool:
+    """Check that the browser behind a crawler is still connected"""
+    strategy = getattr(crawler_instance, "crawler_strategy", None)
+    browser = getattr(getattr(strategy, "browser_manager", None), "browser", None)
+    if browser is not None and hasattr(browser, "is_connected"):
+        try:
+            return bool(browser.is_connected())
+        except Exception:
+            return False
+    return True
+
+async def _create_crawler(config: Dict[str, Any] = None):
+    """Launch a new crawler instance"""
+    # Import Crawl4AI when needed
+    try:
+        from crawl4ai import AsyncWebCrawler, BrowserConfig
+    except ImportError as e:
+        logger.error(f"Failed to import crawl4ai: {e}")
+        raise RuntimeError("Crawl4AI is not installed. Please install it with: pip install crawl4ai")
+    
+    try:
+        with quiet_output():  # Suppress crawler initialization output
+            browser_config = BrowserConfig(
+                headless=config.get("headless", True) if config else True,
+                user_agent=USER_AGENT,
+                viewport={"width": 1920, "height": 1080},
+                extra_args=["--disable-dev-shm-usage", "--no-sandbox"],
+                verbose=False
+            )
+            crawler_instance = AsyncWebCrawler(config=browser_config)
+            # Every page gets the network profile of the call that opened it
+            crawler_instance.crawler_strategy.set_hook("on_page_context_created", block_requests)
+            # Start the browser up front if the method exists
+            if hasattr(crawler_instance, 'start'):
+                await crawler_instance.start()
+            elif hasattr(crawler_instance, 'awarmup'):
+                await crawler_instance.awarmup()
+            logger.info("Crawler instance created successfully")
+    except Exception as e:
+        logger.error(f"Failed to create crawler: {e}")
+        raise
+    return crawler_instance
+
+def get_crawler_pool(config: Dict[str, Any] = None) -> CrawlerPool:
+    """Get or create the crawler pool"""
+    global crawler_pool
+    if crawler_pool is None:
+        crawler_pool = CrawlerPool(config=config)
+        logger.info(f"Crawler pool created with {crawler_pool.size} slots")
+    return crawler_pool
+
+# Plain HTTP client settings
+HTTP_TIMEOUT = _env_int("CRAWL4AI_HTTP_TIMEOUT", 15)
+HTTP_MAX_CONNECTIONS = _env_int("CRAWL4AI_HTTP_MAX_CONNECTIONS", 64)
+
+# Global HTTP session shared by every non-browser request
+http_session = None
+
+async def get_http_session():
+    """Get or create the pooled aiohttp session"""
+    # Import aiohttp when needed
+    try:
+        import aiohttp
+    except ImportError as e:
+        logger.error(f"Failed to import aiohttp: {e}")
+        raise RuntimeError("aiohttp is not installed. Please install it with: pip install aiohttp")
+    
+    global http_session
+    if http_session is None or http_session.closed:
+        http_session = aiohttp.ClientSession(
+            headers={"User-Agent": USER_AGENT, "Accept-Language": "en;q=0.9, *;q=0.5"},
+            timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT),
+            connector=aiohttp.TCPConnector(limit=HTTP_MAX_CONNECTIONS, ttl_dns_cache=300),
+        )
+    return http_session
+
+# Worker processes for HTML conversion, text metrics and serialization of large pages
+WORKERS = _env_int("CRAWL4AI_WORKERS", min(4, os.cpu_count() or 1))
+OFFLOAD_MIN_BYTES = _env_int("CRAWL4AI_OFFLOAD_MIN_KB", 256) * 1024
+
+# Global worker pool; None until the first large page arrives
+worker_pool = None
+
+def _init_worker():
+    """Keep worker output off the MCP stdout channel and preload the converters"""
+    os.dup2(os.open(os.devnull, os.O_WRONLY), 1)
+    sys.stdout = sys.stderr
+    try:
+        importlib.import_module("crawl4ai.content_scraping_strategy")
+        importlib.import_module("crawl4ai.markdown_generation_strategy")
+    except ImportError:
+        pass
+
+def get_worker_pool():
+    """Get or create the worker process pool, or None when CRAWL4AI_WORKERS is 0"""
+    global worker_pool
+    if worker_pool is None and WORKERS > 0:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        # spawn rather than fork: the server process holds an event loop, threads and browsers
+        worker_pool = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context("spawn"),
+                                          initializer=_init_worker)
+        logger.info(f"Worker pool created with {WORKERS} processes")
+    return worker_pool
+
+async def offload(func: Callable[..., Any], *args, size: int = 0) -> Any:
+    """Run a CPU-bound module-level function, in a worker process when size is large
+
+    Below OFFLOAD_MIN_BYTES, copying the arguments to a worker costs more than
+    the work itself, so the call runs inline.
+    """
+    global worker_pool
+    pool = get_worker_pool() if size >= OFFLOAD_MIN_BYTES else None
+    if pool is None:
+        return func(*args)
+    from concurrent.futures.process import BrokenProcessPool
+
+    stats.count("offloaded_tasks")
+    try:
+        return await asyncio.get_event_loop().run_in_executor(pool, func, *args)
+    except BrokenProcessPool:
+        # A worker died (e.g. out of memory); start a fresh pool for later calls
+        if worker_pool is pool:
+            worker_pool = None
+            pool.shutdown(wait=False)
+        stats.count("worker_pool_restarts")
+        raise
+
+def to_json(data: Any) -> str:
+    """Serialize a tool response; module-level so it can run in a worker"""
+    return json.dumps(data, indent=2)
+
+# Startup settings
+EAGER_START = _env_bool("CRAWL4AI_EAGER_START", True)
+WARM_BROWSERS = _env_int("CRAWL4AI_WARM_BROWSERS", 1)
+STARTUP_BUDGET_MS = _env_int("CRAWL4AI_STARTUP_BUDGET_MS", 1500)
+
+# Milliseconds since module load at which each startup stage completed
+startup_timings: Dict[str, float] = {}
+
+def _mark_startup(stage: str):
+    startup_timings[stage] = round((time.perf_counter() - PROCESS_STARTED) * 1000, 1)
+
+async def _import_crawl4ai():
+    """Import Crawl4AI in a worker thread; the imports take seconds"""
+    loop = asyncio.get_event_loop()
+    await loop.run_in_executor(None, importlib.import_module, "crawl4ai")
+    await loop.run_in_executor(None, importlib.import_module, "crawl4ai.content_scraping_strategy")
+    _mark_startup("crawl4ai_imported_ms")
+
+async def warm_up(browsers: int = WARM_BROWSERS):
+    """Import Crawl4AI and pre-launch browsers while the MCP session starts"""
+    try:
+        with quiet_output():
+            if browsers > 0:
+                # The pool's warm-up covers the imports, so early tool calls wait for it
+                await get_crawler_pool().start_warmup(browsers, prepare=_import_crawl4ai)
+                _mark_startup("browsers_ready_ms")
+            else:
+                await _import_crawl4ai()
+        logger.info(f"Warm-up finished: {startup_timings}")
+    except Exception as e:
+        logger.error(f"Warm-up failed, crawlers will start on first use: {e}")
+
+async def cleanup():
+    """Cleanup crawler pool, HTTP session and worker processes"""
+    global crawler_pool, http_session, worker_pool
+    if crawler_pool:
+        try:
+            await crawler_pool.close()
+        except Exception as e:
+            logger.error(f"Error closing crawler pool: {e}")
+        finally:
+            crawler_pool = None
+    if http_session:
+        try:
+            await http_session.close()
+        except Exception as e:
+            logger.error(f"Error closing HTTP session: {e}")
+        finally:
+            http_session = None
+    if worker_pool:
+        worker_pool.shutdown(wait=False)
+        worker_pool = None
+
+# Response cache settings
+CACHE_ENABLED = _env_bool("CRAWL4AI_CACHE_ENABLED", True)
+CACHE_DIR = os.environ.get("CRAWL4AI_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "cs-crawler-mcp")
+CACHE_TTL = _env_int("CRAWL4AI_CACHE_TTL", 3600)
+CACHE_MAX_BYTES = _env_int("CRAWL4AI_CACHE_MAX_MB", 256) * 1024 * 1024
+CACHE_MODES = ["use", "bypass", "refresh"]
+
+# Global response cache
+response_cache = None
+
+def normalize_url(url: str) -> str:
+    """Canonical form of a URL used for cache keys and deduplication"""
+    parsed = urlparse(url.strip())
+    scheme = parsed.scheme.lower()
+    host = (parsed.hostname or '').lower()
+    port = parsed.port
+    if port and not ((scheme == "http" and port == 80) or (scheme == "https" and port == 443)):
+        host = f"{host}:{port}"
+    if parsed.username:
+        credentials = parsed.username + (f":{parsed.password}" if parsed.password else '')
+        host = f"{credentials}@{host}"
+    query = urlencode(sorted(parse_qsl(parsed.query, keep_blank_values=True)))
+    return urlunparse((scheme, host, parsed.path or "/", parsed.params, query, ''))
+
+class ResponseCache:
+    """Content-addressed on-disk cache of crawled pages with TTL and LRU eviction
+
+    Entries are JSON files named after the SHA-256 of the normalized URL and
+    the render options. Reads refresh a file's mtime, which doubles as its
+    LRU position when the cache grows past max_bytes.
+    """
+
+    def __init__(self, directory: str = CACHE_DIR, ttl: int = CACHE_TTL,
+                 max_bytes: int = CACHE_MAX_BYTES):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index: Optional["OrderedDict[str, int]"] = None
+        self._total = 0
+
+    def key(self, url: str, options: Optional[Dict[str, Any]] = None) -> str:
+        """Cache key for a URL rendered with the given options"""
+        material = json.dumps({"url": normalize_url(url), "options": options or {}}, sort_keys=True)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _load_index(self):
+        """Scan the cache directory once, oldest entries first"""
+        if self._index is not None:
+            return
+        entries = []
+        if os.path.isdir(self.directory):
+            # Only the two-character shard directories; other stores may live alongside
+            for shard in os.listdir(self.directory):
+                root = os.path.join(self.directory, shard)
+                if len(shard) != 2 or not os.path.isdir(root):
+                    continue
+                for name in os.listdir(root):
+                    if name.endswith(".json"):
+                        try:
+                            stat = os.stat(os.path.join(root, name))
+                        except OSError:
+                            continue
+                        entries.append((stat.st_mtime, name[:-5], stat.st_size))
+        entries.sort()
+        self._index = OrderedDict((key, size) for _, key, size in entries)
+        self._total = sum(self._index.values())
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached page for key, or None if missing or expired"""
+        entry = self.lookup(key)
+        if entry is None or not self.is_fresh(entry):
+            return None
+        return entry["page"]
+
+    def is_fresh(self, entry: Dict[str, Any]) -> bool:
+        """Whether an entry returned by lookup() is still within the TTL"""
+        return time.time() - entry.get("stored_at", 0) <= self.ttl
+
+    def lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the stored entry for key, expired or not, as {"stored_at", "page"}
+
+        Expired pages are kept so they can be revalidated with the origin.
+        """
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        with self._lock:
+            self._load_index()
+            if key in self._index:
+                self._index.move_to_end(key)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry
+
+    def put(self, key: str, page: Dict[str, Any]):
+        """Store a page, evicting least recently used entries if needed"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps({"stored_at": time.time(), "page": page}).encode("utf-8")
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._load_index()
+            self._total += len(data) - self._index.pop(key, 0)
+            self._index[key] = len(data)
+            self._evict()
+
+    def _evict(self):
+        """Drop least recently used entries until the cache fits max_bytes"""
+        while self._total > self.max_bytes and len(self._index) > 1:
+            key, size = self._index.popitem(last=False)
+            self._total -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    async def alookup(self, key: str) -> Optional[Dict[str, Any]]:
+        """lookup() without blocking the event loop"""
+        return await asyncio.get_event_loop().run_in_executor(None, self.lookup, key)
+
+    async def aput(self, key: str, page: Dict[str, Any]):
+        """put() without blocking the event loop"""
+        await asyncio.get_event_loop().run_in_executor(None, self.put, key, page)
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Get or create the response cache, or None when caching is disabled"""
+    global response_cache
+    if response_cache is None and CACHE_ENABLED:
+        response_cache = ResponseCache()
+        logger.info(f"Response cache at {response_cache.directory}")
+    return response_cache
+
+# Page snapshots compared by crawl_changes; they never expire, only the LRU limit drops them
+SNAPSHOT_DIR = os.environ.get("CRAWL4AI_SNAPSHOT_DIR") or os.path.join(CACHE_DIR, "snapshots")
+SNAPSHOT_MAX_BYTES = _env_int("CRAWL4AI_SNAPSHOT_MAX_MB", 64) * 1024 * 1024
+
+# Global snapshot store
+snapshot_store = None
+
+def get_snapshot_store() -> ResponseCache:
+    """Get or create the snapshot store used by crawl_changes"""
+    global snapshot_store
+    if snapshot_store is None:
+        snapshot_store = ResponseCache(directory=SNAPSHOT_DIR, ttl=sys.maxsize, max_bytes=SNAPSHOT_MAX_BYTES)
+    return snapshot_store
+
+OUTPUT_FORMATS = ["markdown", "html", "text", "json"]
+
+# 0 returns whole pages; a positive value paginates crawl_url output by default
+DEFAULT_MAX_CHARS = _env_int("CRAWL4AI_MAX_RESPONSE_CHARS", 0)
+
+# Called as progress(done, total, message) to emit MCP progress notifications
+ProgressCallback = Callable[[float, Optional[float], Optional[str]], Awaitable[None]]
+
+RENDER_MODES = ["auto", "static", "browser"]
+DEFAULT_RENDER = os.environ.get("CRAWL4AI_DEFAULT_RENDER", "auto")
+if DEFAULT_RENDER not in RENDER_MODES:
+    DEFAULT_RENDER = "auto"
+
+RENDER_SCHEMA = {
+    "type": "string",
+    "enum": RENDER_MODES,
+    "description": "auto: fetch over plain HTTP and use the browser only when the page needs JavaScript; static: never use the browser; browser: always render in headless Chromium (default: auto)"
+}
+
+CACHE_MODE_SCHEMA = {
+    "type": "string",
+    "enum": CACHE_MODES,
+    "description": "use: serve fresh cached pages; bypass: neither read nor write the cache; refresh: re-crawl and overwrite the cache (default: use)"
+}
+
+# Resource types each network profile aborts in the browser; trackers are blocked unless the profile is full
+NETWORK_PROFILES = {
+    "text-only": {"image", "media", "font", "stylesheet", "texttrack", "eventsource", "manifest"},
+    "text+images-metadata": {"media", "font", "texttrack", "eventsource", "manifest"},
+    "full": set(),
+}
+DEFAULT_NETWORK_PROFILE = os.environ.get("CRAWL4AI_NETWORK_PROFILE", "text-only")
+if DEFAULT_NETWORK_PROFILE not in NETWORK_PROFILES:
+    DEFAULT_NETWORK_PROFILE = "text-only"
+
+NETWORK_PROFILE_SCHEMA = {
+    "type": "string",
+    "enum": list(NETWORK_PROFILES),
+    "description": "Requests the browser skips: text-only blocks images, media, fonts, stylesheets and trackers; text+images-metadata loads images but blocks the rest; full blocks nothing (default: text-only)"
+}
+
+# Ad, analytics and tag-manager hosts; subdomains are blocked too
+TRACKER_DOMAINS = frozenset({
+    "2mdn.net", "adnxs.com", "adsafeprotected.com", "adsrvr.org", "amazon-adsystem.com", "chartbeat.com",
+    "chartbeat.net", "criteo.com", "criteo.net", "demdex.net", "doubleclick.net", "doubleverify.com",
+    "facebook.net", "google-analytics.com", "googleadservices.com", "googlesyndication.com",
+    "googletagmanager.com", "googletagservices.com", "hotjar.com", "krxd.net", "mixpanel.com",
+    "moatads.com", "nr-data.net", "omtrdc.net", "outbrain.com", "pubmatic.com", "quantserve.com",
+    "rubiconproject.com", "scorecardresearch.com", "segment.io", "taboola.com",
+}) | frozenset(domain.strip().lower() for domain in os.environ.get("CRAWL4AI_BLOCK_DOMAINS", '').split(",") if domain.strip())
+
+def is_tracker(url: str) -> bool:
+    """Whether url's host or one of its parent domains is on the tracker blocklist"""
+    labels = (urlparse(url).hostname or '').split(".")
+    return any(".".join(labels[i:]) in TRACKER_DOMAINS for i in range(len(labels) - 1))
+
+async def block_requests(page, context=None, config=None, **kwargs):
+    """Crawl4AI hook that aborts requests the call's network profile does not need"""
+    shared = getattr(config, "shared_data", None) or {}
+    profile = shared.get("network_profile", DEFAULT_NETWORK_PROFILE)
+    if profile == "full":
+        return page
+    blocked_types = NETWORK_PROFILES[profile]
+
+    async def route(request_route):
+        request = request_route.request
+        # The page being crawled is never blocked, even on a blocklisted host
+        if request.is_navigation_request() and request.frame.parent_frame is None:
+            await request_route.continue_()
+        elif request.resource_type in blocked_types or is_tracker(request.url):
+            stats.count("blocked_requests")
+            await request_route.abort()
+        else:
+            await request_route.continue_()
+
+    await page.unroute("**/*")
+    await page.route("**/*", route)
+    return page
+
+# Browser wait strategies; "css:<selector>" waits for a matching element
+WAIT_CONDITIONS = ["domcontentloaded", "load", "networkidle", "stable"]
+DEFAULT_WAIT_FOR = os.environ.get("CRAWL4AI_WAIT_FOR", "domcontentloaded")
+DEFAULT_TIMEOUT_MS = _env_int("CRAWL4AI_TIMEOUT_MS", 60000)
+WAIT_MAX_MS = _env_int("CRAWL4AI_WAIT_MAX_MS", 10000)
+WAIT_QUIET_MS = 500
+
+WAIT_FOR_SCHEMA = {
+    "type": "string",
+    "description": "When a browser-rendered page is ready: domcontentloaded (default), load, networkidle (no new requests for 0.5s), stable (text stops growing for 0.5s) or css:<selector>. Waits other than domcontentloaded and load give up after CRAWL4AI_WAIT_MAX_MS and return the page as it is"
+}
+
+TIMEOUT_MS_SCHEMA = {
+    "type": "integer",
+    "minimum": 1000,
+    "description": "Hard limit in milliseconds for fetching one page, including browser navigation, waiting and retries (default: 60000)"
+}
+
+# Polled in the page every 100 ms by Crawl4AI until true or the wait budget is spent
+QUIET_NETWORK_JS = """(() => {
+    performance.setResourceTimingBufferSize(100000);
+    let seen = -1, since = Date.now();
+    return () => {
+        const count = performance.getEntriesByType("resource").length;
+        if (count !== seen) { seen = count; since = Date.now(); }
+        return Date.now() - since >= %d;
+    };
+})()"""
+STABLE_TEXT_JS = """(() => {
+    let seen = -1, since = Date.now();
+    return () => {
+        const length = document.body ? document.body.textContent.length : 0;
+        if (length !== seen) { seen = length; since = Date.now(); }
+        return length > 0 && Date.now() - since >= %d;
+    };
+})()"""
+
+def validate_wait_for(wait_for: Any) -> Optional[str]:
+    """Return an error message if wait_for is not a known strategy"""
+    if not isinstance(wait_for, str) or not (
+            wait_for in WAIT_CONDITIONS or (wait_for.startswith("css:") and wait_for[4:].strip())):
+        return f"Error: Invalid wait_for: {wait_for} (use one of {', '.join(WAIT_CONDITIONS)} or css:<selector>)"
+    return None
+
+if validate_wait_for(DEFAULT_WAIT_FOR):
+    DEFAULT_WAIT_FOR = "domcontentloaded"
+
+def wait_settings(wait_for: str, timeout_ms: int) -> Dict[str, Any]:
+    """Translate a wait strategy into CrawlerRunConfig arguments"""
+    settings = {"wait_until": "load" if wait_for == "load" else "domcontentloaded", "page_timeout": timeout_ms}
+    if wait_for == "networkidle":
+        condition = QUIET_NETWORK_JS % WAIT_QUIET_MS
+    elif wait_for == "stable":
+        condition = STABLE_TEXT_JS % WAIT_QUIET_MS
+    elif wait_for.startswith("css:"):
+        # A JS condition ends the wait softly at the budget, where css: would fail the crawl
+        condition = f"() => document.querySelector({json.dumps(wait_for[4:].strip())}) !== null"
+    else:
+        return settings
+    settings["wait_for"] = "js:" + condition
+    settings["wait_for_timeout"] = min(WAIT_MAX_MS, timeout_ms // 2)
+    return settings
+
+# Batch crawl limits
+BATCH_MAX_URLS = _env_int("CRAWL4AI_MAX_BATCH_URLS", 100)
+BATCH_PER_HOST_LIMIT = 2
+BATCH_PER_HOST_DELAY = 0.5
+
+# Retries of transient failures, with jittered exponential backoff
+DEFAULT_RETRIES = _env_int("CRAWL4AI_RETRIES", 2)
+RETRY_BACKOFF = 1.0
+RETRY_MAX_DELAY = _env_int("CRAWL4AI_RETRY_MAX_DELAY", 60)
+RETRY_MIN_ATTEMPT_MS = 1000  # a retry needs at least this much of timeout_ms left
+THROTTLE_STATUSES = {429, 503}
+TRANSIENT_ERRORS = re.compile(
+    r"no (?:response|result) within|timed? ?out|ERR_(?:CONNECTION_(?:RESET|CLOSED|REFUSED)|TIMED_OUT|"
+    r"NETWORK_CHANGED|EMPTY_RESPONSE)|ECONNRESET|connection reset|server disconnected",
+    re.IGNORECASE
+)
+
+# Adaptive per-host rates in requests per second; hosts start unthrottled
+# but never get more than HOST_MAX_CONCURRENCY requests at once
+HOST_MAX_CONCURRENCY = _env_int("CRAWL4AI_HOST_CONCURRENCY", 4)
+HOST_THROTTLED_RATE = 1.0
+HOST_MIN_RATE = 0.05
+HOST_MAX_RATE = 20.0
+HOST_RECOVERY = 1.25
+
+RETRIES_SCHEMA = {
+    "type": "integer",
+    "minimum": 0,
+    "maximum": 10,
+    "description": f"Retries per page after timeouts, connection resets, 429 and 5xx responses, with jittered exponential backoff (default: {DEFAULT_RETRIES})"
+}
+
+RETRY_BACKOFF_SCHEMA = {
+    "type": "number",
+    "minimum": 0,
+    "description": f"Seconds before the first retry, doubled for each further one; Retry-After takes precedence (default: {RETRY_BACKOFF})"
+}
+
+class CrawlError(Exception):
+    """Raised when Crawl4AI reports that a page could not be crawled"""
+
+def is_transient(error: BaseException) -> bool:
+    """Whether a failed fetch may succeed when tried again"""
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    try:
+        import aiohttp
+    except ImportError:
+        pass
+    else:
+        if isinstance(error, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError)):
+            return True
+    return bool(TRANSIENT_ERRORS.search(str(error)))
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header, given as seconds or an HTTP date"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    from email.utils import parsedate_to_datetime
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError):
+        return None
+
+def validate_url(url: Optional[str]) -> Optional[str]:
+    """Return an error message if url is missing or malformed"""
+    if not url:
+        return "Error: URL is required"
+    parsed = urlparse(url)
+    if not parsed.scheme or not parsed.netloc:
+        return f"Error: Invalid URL format: {url}"
+    return None
+
+def _plain(value: Any) -> Any:
+    """Convert Crawl4AI models inside links/media into JSON-safe structures"""
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    if isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    return value
+
+# Created on first use because Crawl4AI is imported lazily
+_deferred_scraping = None
+
+def _deferred_scraping_strategy():
+    """Scraping strategy that leaves conversion of the rendered HTML to render_page"""
+    global _deferred_scraping
+    if _deferred_scraping is None:
+        from crawl4ai.content_scraping_strategy import ContentScrapingStrategy
+        from crawl4ai.models import ScrapingResult
+
+        class DeferredScraping(ContentScrapingStrategy):
+            logger = None
+
+            def scrap(self, url: str, html: str, **kwargs):
+                return ScrapingResult(cleaned_html='', success=True)
+
+            async def ascrap(self, url: str, html: str, **kwargs):
+                return self.scrap(url, html, **kwargs)
+
+        _deferred_scraping = DeferredScraping()
+    return _deferred_scraping
+
+def _run_config(network_profile: str = DEFAULT_NETWORK_PROFILE, wait_for: str = DEFAULT_WAIT_FOR,
+                timeout_ms: int = DEFAULT_TIMEOUT_MS):
+    """Build the Crawl4AI run configuration used for a navigation"""
+    from crawl4ai import CacheMode, CrawlerRunConfig
+
+    # Pages are cached by ResponseCache, so Crawl4AI's own cache is bypassed, and
+    # Crawl4AI would convert on the event loop, so render_page does it with offload()
+    return CrawlerRunConfig(cache_mode=CacheMode.BYPASS, scraping_strategy=_deferred_scraping_strategy(),
+                            shared_data={"network_profile": network_profile}, verbose=False,
+                            **wait_settings(wait_for, timeout_ms))
+
+async def render_page(url: str, network_profile: str = DEFAULT_NETWORK_PROFILE, wait_for: str = DEFAULT_WAIT_FOR,
+                      timeout_ms: int = DEFAULT_TIMEOUT_MS) -> Dict[str, Any]:
+    """Crawl a single URL with a pooled crawler"""
+    config = _run_config(network_profile, wait_for, timeout_ms)
+    # Lease a crawler from the pool
+    async with get_crawler_pool().lease(timeout_ms / 1000) as crawler_instance:
+        # Suppress all Crawl4AI output during crawling
+        with quiet_output(), timed("navigation"):
+            try:
+                # A navigation still running at the deadline fails the lease, which recycles the browser
+                result = await asyncio.wait_for(crawler_instance.arun(url=url, config=config), timeout_ms / 1000)
+            except asyncio.TimeoutError:
+                raise CrawlError(f"Failed to crawl {url}: no result within {timeout_ms} ms")
+    
+    if not result.success:
+        raise CrawlError(f"Failed to crawl {url}: {result.error_message if hasattr(result, 'error_message') else 'Unknown error'}")
+    html = result.html or ''
+    status_code = result.status_code or 200
+    # The rendered DOM differs from the response body, so only the headers can validate it
+    headers = getattr(result, "response_headers", None) or {}
+    validators = page_validators(headers)
+    retry_after = parse_retry_after(next((value for name, value in headers.items() if name.lower() == "retry-after"), None))
+    # Release Crawl4AI's result (raw, cleaned and fit HTML, markdown, screenshots) before converting
+    del result
+    with timed("extraction"):
+        page = await offload(html_to_page, url, html, status_code, size=len(html))
+    page["validators"] = validators
+    page["retry_after"] = retry_after
+    return page
+
+# Static fetches larger than this are rejected rather than buffered
+STATIC_MAX_BYTES = _env_int("CRAWL4AI_STATIC_MAX_MB", 32) * 1024 * 1024
+
+# Below this much extracted text a statically fetched page is assumed to need JavaScript
+STATIC_MIN_TEXT = 200
+SPA_MAX_TEXT = 1000
+SPA_ROOT_MARKERS = re.compile(
+    rb'<div[^>]+id=["\']?(root|app|__next|__nuxt|svelte)["\']?[^>]*>\s*</div>|\bng-app\b|\bng-version=',
+    re.IGNORECASE
+)
+NOSCRIPT_WALL = re.compile(
+    rb'<noscript[^>]*>[^<]*(?:<[^/][^>]*>[^<]*)*?(enable javascript|javascript is (?:required|disabled)|requires javascript)',
+    re.IGNORECASE
+)
+BROWSER_CHALLENGE_STATUSES = {403, 429, 503}
+
+# Elements that start a new line of text, and those that also leave a blank line
+TEXT_LINE_TAGS = frozenset({"br", "li", "tr", "dt", "dd", "figcaption", "option"})
+TEXT_BLOCK_TAGS = frozenset({
+    "address", "article", "aside", "blockquote", "div", "dl", "fieldset", "figure", "footer", "form",
+    "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "main", "nav", "ol", "p", "pre", "section",
+    "table", "ul",
+})
+TEXT_SKIPPED_TAGS = frozenset({"head", "script", "style", "noscript", "template", "svg", "iframe"})
+MEDIA_TAGS = {"img": "images", "video": "videos", "audio": "audios"}
+PARSE_CHUNK_CHARS = 64 * 1024
+URL_SCHEME = re.compile(r"[a-zA-Z][a-zA-Z0-9+.-]*:")
+
+def analyze_html(url: str, html: str) -> Dict[str, Any]:
+    """Plain text, word count, heading outline and link and media tallies in one pass
+
+    The HTML is fed to lxml's pull parser in chunks. Text is emitted as soon
+    as it is complete: an element's text at its first child's start or its
+    own end, a child's tail at the next sibling's start or the parent's end.
+    Finished elements are cleared, so the tree never holds the whole page.
+    """
+    from lxml import etree
+
+    parser = etree.HTMLPullParser(events=("start", "end"), remove_comments=True, remove_pis=True)
+    host = (urlparse(url).hostname or '').lower()
+    pieces: List[str] = []
+    headings: List[Dict[str, Any]] = []
+    heading_start = None
+    links = {"internal": 0, "external": 0}
+    media = {kind: 0 for kind in MEDIA_TAGS.values()}
+    skipping = 0
+    
+    def emit(text: Optional[str]):
+        # Line breaks in the source are layout, not text
+        if text and not skipping:
+            pieces.append(text.replace("\n", " "))
+    
+    def brk(separator: str):
+        if not skipping:
+            pieces.append(separator)
+    
+    def handle(event: str, element):
+        nonlocal skipping, heading_start
+        tag = element.tag if isinstance(element.tag, str) else ''
+        if event == "start":
+            previous = element.getprevious()
+            if previous is not None:
+                emit(previous.tail)
+            elif element.getparent() is not None:
+                emit(element.getparent().text)
+            if tag in TEXT_SKIPPED_TAGS:
+                skipping += 1
+            elif tag in TEXT_BLOCK_TAGS:
+                brk("\n\n")
+            elif tag in TEXT_LINE_TAGS:
+                brk("\n")
+            elif tag in ("td", "th"):
+                brk(" ")
+            if tag in ("h1", "h2", "h3", "h4", "h5", "h6") and not skipping:
+                heading_start = len(pieces)
+            elif tag == "a" and not skipping and element.get("href"):
+                href = element.get("href").strip()
+                # Relative links stay on the page's host; only absolute ones need parsing
+                if href.startswith(("http://", "https://", "//")):
+                    links["internal" if (urlparse(urljoin(url, href)).hostname or '').lower() == host
+                          else "external"] += 1
+                elif not URL_SCHEME.match(href):
+                    links["internal"] += 1
+            elif tag in MEDIA_TAGS and not skipping:
+                media[MEDIA_TAGS[tag]] += 1
+            return
+        last_child = element[-1] if len(element) else None
+        emit(last_child.tail if last_child is not None else element.text)
+        if tag in TEXT_SKIPPED_TAGS:
+            skipping -= 1
+        elif tag in TEXT_BLOCK_TAGS:
+            brk("\n\n")
+        if heading_start is not None and tag in ("h1", "h2", "h3", "h4", "h5", "h6"):
+            title = " ".join("".join(pieces[heading_start:]).split())
+            if title:
+                headings.append({"level": int(tag[1]), "text": title})
+            heading_start = None
+        # Only the last finished child's tail is still needed
+        element.clear(keep_tail=True)
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+    
+    for start in range(0, len(html), PARSE_CHUNK_CHARS):
+        parser.feed(html[start:start + PARSE_CHUNK_CHARS])
+        for event, element in parser.read_events():
+            handle(event, element)
+    try:
+        parser.close()
+    except etree.XMLSyntaxError:
+        pass
+    for event, element in parser.read_events():
+        handle(event, element)
+    
+    lines = []
+    for line in "".join(pieces).split("\n"):
+        line = " ".join(line.split())
+        if line or (lines and lines[-1]):
+            lines.append(line)
+    text = "\n".join(lines).strip()
+    return {
+        "text": text,
+        "word_count": len(text.split()),
+        "outline": headings,
+        "link_counts": links,
+        "media_counts": media,
+    }
+
+class PageRecord:
+    """A converted page, holding one copy of each representation the cache keeps
+
+    Plain text is not stored but rendered from cleaned_html when a call asks
+    for it, and the raw HTML is never kept. Fields are read like dict keys,
+    so code handling pages accepts records and plain dicts alike.
+    """
+
+    __slots__ = ("url", "title", "status_code", "language", "markdown", "cleaned_html", "links", "media",
+                 "validators", "retry_after", "word_count", "outline", "link_counts", "media_counts")
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "PageRecord":
+        """Build a record from a cache entry"""
+        return cls(**data)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __getitem__(self, name: str) -> Any:
+        try:
+            return getattr(self, name)
+        except (AttributeError, TypeError):
+            raise KeyError(name)
+
+    def __setitem__(self, name: str, value: Any):
+        setattr(self, name, value)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.__slots__
+
+    def get(self, name: str, default: Any = None) -> Any:
+        return getattr(self, name, default) if name in self.__slots__ else default
+
+def page_text(page) -> str:
+    """Render a page's plain text from its cleaned HTML"""
+    return analyze_html(page["url"], page["cleaned_html"] or '')["text"]
+
+def html_to_page(url: str, html: str, status_code: int = 200) -> PageRecord:
+    """Clean and convert raw HTML to a page record without a browser
+
+    Uses the same scraping and markdown strategies Crawl4AI applies after a
+    browser navigation, so both render paths produce comparable output.
+    """
+    from crawl4ai.content_scraping_strategy import LXMLWebScrapingStrategy
+    from crawl4ai.markdown_generation_strategy import DefaultMarkdownGenerator
+
+    scraped = LXMLWebScrapingStrategy().scrap(url, html)
+    markdown = DefaultMarkdownGenerator().generate_markdown(scraped.cleaned_html, base_url=url)
+    metadata = scraped.metadata or {}
+    language = re.search(r'<html[^>]*\blang=["\']?([\w-]+)', html[:4096], re.IGNORECASE)
+    analysis = analyze_html(url, scraped.cleaned_html)
+    del analysis["text"]
+    return PageRecord(
+        url=url,
+        title=" ".join((metadata.get("title") or '').split()),
+        markdown=markdown.raw_markdown,
+        cleaned_html=scraped.cleaned_html,
+        links=_plain(scraped.links),
+        media=_plain(scraped.media),
+        status_code=status_code,
+        language=language.group(1) if language else '',
+        **analysis,
+    )
+
+def browser_needed(raw_html: bytes, page: Dict[str, Any]) -> Optional[str]:
+    """Say why a statically fetched page should be re-rendered, if it should"""
+    if page["status_code"] in BROWSER_CHALLENGE_STATUSES:
+        return f"HTTP {page['status_code']} may be a bot challenge"
+    text_length = len(page["markdown"].strip())
+    if text_length < STATIC_MIN_TEXT:
+        return f"only {text_length} characters of text"
+    if NOSCRIPT_WALL.search(raw_html):
+        return "<noscript> asks for JavaScript"
+    if text_length < SPA_MAX_TEXT and SPA_ROOT_MARKERS.search(raw_html):
+        return "single-page app root with little text"
+    return None
+
+def page_validators(headers, body: Optional[bytes] = None) -> Dict[str, Optional[str]]:
+    """ETag, Last-Modified and body hash used to revalidate a cached page"""
+    headers = {name.lower(): value for name, value in headers.items()}
+    return {
+        "etag": headers.get("etag"),
+        "last_modified": headers.get("last-modified"),
+        "content_hash": hashlib.sha256(body).hexdigest() if body is not None else None,
+    }
+
+async def revalidate(url: str, validators: Dict[str, Optional[str]]) -> bool:
+    """Ask the origin with a conditional request whether a cached page is unchanged
+
+    A 304, or a 200 whose body hashes to the stored content hash, means
+    unchanged. Any other answer or error means the page has to be crawled again.
+    """
+    headers = {}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    if not headers and not validators.get("content_hash"):
+        return False
+    try:
+        session = await get_http_session()
+        async with session.get(url, headers=headers) as response:
+            if response.status == 304:
+                return True
+            if response.status != 200 or not validators.get("content_hash"):
+                return False
+            body = await response.content.read(STATIC_MAX_BYTES + 1)
+            return hashlib.sha256(body).hexdigest() == validators["content_hash"]
+    except Exception as e:
+        logger.info(f"Could not revalidate {url}: {e}")
+        return False
+
+def convert_static(url: str, body: bytes, encoding: str, status_code: int):
+    """Decode and convert a static response and decide whether it needs a browser"""
+    page = html_to_page(url, body.decode(encoding, errors="replace"), status_code)
+    return page, browser_needed(body, page)
+
+async def fetch_static_page(url: str):
+    """Fetch a page over plain HTTP and convert it in-process
+
+    Returns the page dict and the reason it needs a browser, or None.
+    """
+    session = await get_http_session()
+    with timed("navigation"):
+        async with session.get(url) as response:
+            content_type = response.headers.get("Content-Type", '')
+            if content_type and "html" not in content_type.lower():
+                raise CrawlError(f"Failed to crawl {url}: unsupported content type {content_type}")
+            body = await response.content.read(STATIC_MAX_BYTES + 1)
+            if len(body) > STATIC_MAX_BYTES:
+                raise CrawlError(f"Failed to crawl {url}: page is larger than {STATIC_MAX_BYTES} bytes")
+            encoding = response.get_encoding() if response.charset else "utf-8"
+            status_code = response.status
+            validators = page_validators(response.headers, body)
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+    
+    with timed("extraction"):
+        page, reason = await offload(convert_static, url, body, encoding, status_code, size=len(body))
+    page["validators"] = validators
+    page["retry_after"] = retry_after
+    return page, reason
+
+async def load_page(url: str, render: str = "auto", timeout_ms: int = DEFAULT_TIMEOUT_MS, **options) -> Dict[str, Any]:
+    """Fetch a page statically, in the browser, or statically with escalation
+
+    options are browser settings passed on to render_page. timeout_ms bounds
+    the static fetch and any browser escalation together.
+    """
+    deadline = time.monotonic() + timeout_ms / 1000
+    if render != "browser":
+        try:
+            page, reason = await asyncio.wait_for(fetch_static_page(url), timeout_ms / 1000)
+        except asyncio.TimeoutError:
+            # The browser would get no time left either
+            raise CrawlError(f"Failed to crawl {url}: no response within {timeout_ms} ms")
+        except Exception as e:
+            if render == "static":
+                raise
+            page, reason = None, f"static fetch failed: {e}"
+        if reason is None or render == "static":
+            return page
+        logger.info(f"Escalating {url} to the browser: {reason}")
+        stats.count("browser_escalations")
+    remaining_ms = int((deadline - time.monotonic()) * 1000)
+    if remaining_ms <= 0:
+        raise CrawlError(f"Failed to crawl {url}: no time left for the browser within {timeout_ms} ms")
+    return await render_page(url, timeout_ms=remaining_ms, **options)
+
+# Pages crawled this recently are reused by follow-up calls without a new fetch
+REUSE_WINDOW = _env_int("CRAWL4AI_REUSE_WINDOW", 30)
+REUSE_MAX_PAGES = 64
+
+class SingleFlight:
+    """Run one coroutine per key and share its result with concurrent callers"""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+        self.shared = 0
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """Await the in-flight call for key, starting it if there is none"""
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(factory())
+            self._calls[key] = future
+            future.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self.shared += 1
+            stats.count("coalesced_crawls")
+        # A cancelled caller must not cancel the navigation others are awaiting
+        return await asyncio.shield(future)
+
+class RecentPages:
+    """Short-lived memory of crawled pages keyed on normalized URL, render mode and options"""
+
+    def __init__(self, window: float = REUSE_WINDOW, max_pages: int = REUSE_MAX_PAGES):
+        self.window = window
+        self.max_pages = max_pages
+        self._pages: "OrderedDict[tuple, tuple]" = OrderedDict()
+
+    @staticmethod
+    def _options_key(options: Dict[str, Any]) -> tuple:
+        return tuple(f"{name}={value}" for name, value in sorted(options.items()))
+
+    def get(self, url: str, render: Optional[str] = None,
+            options: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Return a page crawled within the window
+
+        render=None accepts any mode and options=None any crawl options.
+        """
+        now = time.monotonic()
+        url = normalize_url(url)
+        renders = RENDER_MODES if render is None else ([render, "static", "browser"] if render == "auto" else [render])
+        for mode in renders:
+            if options is not None:
+                entry = self._pages.get((url, mode, self._options_key(options)))
+            else:
+                entry = next((value for key, value in reversed(self._pages.items())
+                              if key[:2] == (url, mode) and value[0] > now), None)
+            if entry is not None and entry[0] > now:
+                return entry[1]
+        return None
+
+    def put(self, url: str, render: str, page: Dict[str, Any], options: Optional[Dict[str, Any]] = None):
+        """Remember a page crawled with options for the reuse window"""
+        if self.window <= 0:
+            return
+        key = (normalize_url(url), render, self._options_key(options or {}))
+        now = time.monotonic()
+        self._pages.pop(key, None)
+        self._pages[key] = (now + self.window, page)
+        # Entries expire in insertion order, so expired pages are dropped from the front
+        while self._pages and (len(self._pages) > self.max_pages or next(iter(self._pages.values()))[0] <= now):
+            self._pages.popitem(last=False)
+
+    def clear(self):
+        self._pages.clear()
+
+# In-flight crawls and recently crawled pages, shared by every tool call
+inflight_crawls = SingleFlight()
+recent_pages = RecentPages()
+
+def trim_memory():
+    """Let go of memory kept for reuse: recent pages and the worker processes"""
+    global worker_pool
+    recent_pages.clear()
+    if worker_pool is not None:
+        # Running conversions finish; the next large page starts fresh workers
+        worker_pool.shutdown(wait=False)
+        worker_pool = None
+    gc.collect()
+
+async def fetch_page(url: str, cache_mode: str = "use", render: str = "browser",
+                     timeout_ms: int = DEFAULT_TIMEOUT_MS, scheduler: Optional["HostScheduler"] = None,
+                     limit: Optional[asyncio.Semaphore] = None, deadline: Optional[float] = None,
+                     timings: Optional[Dict[str, float]] = None, **options) -> Dict[str, Any]:
+    """Return a crawled page, reusing recent, cached or in-flight results when allowed
+
+    options change what is crawled and are part of the cache key; the other
+    arguments are not. Only a crawl that goes to the network waits for a
+    slot: limit first, then scheduler's host slot when given, else the
+    process-wide host_limiter's. deadline, a time.monotonic() value, shortens
+    timeout_ms once the slots are held. The crawl puts its slot wait and
+    the time.monotonic() it started at into timings as queue_ms and started.
+    """
+    if cache_mode == "use":
+        page = recent_pages.get(url, render, options)
+        if page is not None:
+            logger.info(f"Reusing page crawled moments ago for {url}")
+            stats.count("recent_page_reuses")
+            return page
+    
+    cache = get_response_cache()
+    key = cache.key(url, {"render": render, **options}) if cache else None
+    stale = None
+    if cache and cache_mode == "use":
+        with timed("cache"):
+            entry = await cache.alookup(key)
+        if entry is not None and cache.is_fresh(entry):
+            logger.info(f"Cache hit for {url}")
+            stats.count("cache_hits")
+            return PageRecord.from_dict(entry["page"])
+        stale = PageRecord.from_dict(entry["page"]) if entry is not None else None
+        stats.count("cache_misses")
+    
+    async def crawl() -> Dict[str, Any]:
+        host = urlparse(url).netloc.lower()
+        page = None
+        queued = time.perf_counter()
+        async with AsyncExitStack() as stack:
+            # The global limit comes first, so a held host slot is never kept waiting on it
+            if limit is not None:
+                await stack.enter_async_context(acquire_timed(limit))
+            await stack.enter_async_context(scheduler.slot(url) if scheduler else host_limiter.slot(host))
+            budget_ms = timeout_ms
+            if deadline is not None:
+                budget_ms = min(timeout_ms, round((deadline - time.monotonic()) * 1000))
+                if budget_ms < 1:
+                    raise CrawlError(f"Failed to crawl {url}: no time left within timeout_ms")
+            if timings is not None:
+                timings.update(queue_ms=(time.perf_counter() - queued) * 1000, started=time.monotonic())
+            if stale is not None and stale.get("validators"):
+                with timed("revalidation"):
+                    if await revalidate(url, stale["validators"]):
+                        logger.info(f"Cached page for {url} is unchanged at the origin")
+                        stats.count("cache_revalidations")
+                        page = stale
+            if page is None:
+                page = await load_page(url, render, timeout_ms=budget_ms, **options)
+        # Calls sharing this crawl get the same page, so the host's answer counts once here
+        host_limiter.record(host, page["status_code"], page.get("retry_after"))
+        # Throttling and server errors are passing states, not the page's content
+        if page["status_code"] in THROTTLE_STATUSES or page["status_code"] >= 500:
+            return page
+        recent_pages.put(url, render, page, options)
+        if cache and cache_mode != "bypass":
+            with timed("cache"):
+                await cache.aput(key, page.to_dict() if isinstance(page, PageRecord) else page)
+        return page
+    
+    # A refresh or bypass must not join a flight that may hand out a revalidated cached page
+    flight = " ".join([normalize_url(url), render, cache_mode] +
+                      [f"{name}={value}" for name, value in sorted(options.items())])
+    return await inflight_crawls.do(flight, crawl)
+
+# Split points preferred when paginating, strongest first
+MARKDOWN_BREAKS = [re.compile(r"\n(?=#{1,6} )"), re.compile(r"\n\s*\n"), re.compile(r"\n")]
+HTML_BREAKS = [re.compile(r"(?=<h[1-6][\s>])", re.IGNORECASE), re.compile(r"(?<=</p>)|(?<=</div>)|(?<=</section>)", re.IGNORECASE), re.compile(r"\n")]
+
+class OffsetError(ValueError):
+    """Raised when a requested offset lies past the end of the content"""
+
+def paginate(content: str, offset: int, max_chars: int, output_format: str = "markdown"):
+    """Cut one chunk of at most max_chars starting at offset
+
+    The chunk ends at the last heading, then paragraph, then line break found
+    in its second half, so sections stay intact where possible. Returns the
+    chunk and the offset of the next one (None at the end).
+    """
+    end = offset + max_chars
+    if end >= len(content):
+        return content[offset:], None
+    window_start = offset + max_chars // 2
+    for pattern in (HTML_BREAKS if output_format == "html" else MARKDOWN_BREAKS):
+        breaks = [match.end() for match in pattern.finditer(content, window_start, end)]
+        if breaks and breaks[-1] > offset:
+            end = breaks[-1]
+            break
+    return content[offset:end], end
+
+def page_size(page: Dict[str, Any]) -> int:
+    """Characters format_result may have to scan, used to decide on offloading"""
+    return len(page["markdown"] or '') + len(page["cleaned_html"] or '')
+
+def page_counts(page: Dict[str, Any]) -> Dict[str, int]:
+    """Word, link and media counts reported by the json format and get_metadata"""
+    return {
+        "word_count": page["word_count"],
+        "links_count": sum(page["link_counts"].values()),
+        "media_count": sum(page["media_counts"].values()),
+    }
+
+# Content selection: the whole page, or only its main article
+CONTENT_MODES = ["full", "main"]
+DEFAULT_CONTENT = os.environ.get("CRAWL4AI_DEFAULT_CONTENT", "full")
+if DEFAULT_CONTENT not in CONTENT_MODES:
+    DEFAULT_CONTENT = "full"
+
+CONTENT_SCHEMA = {
+    "type": "string",
+    "enum": CONTENT_MODES,
+    "description": f"full: the whole page; main: only the main article, without navigation, footers, cookie banners and related-link lists (default: {DEFAULT_CONTENT})"
+}
+
+MAX_TOKENS_SCHEMA = {
+    "type": "integer",
+    "minimum": 0,
+    "description": "Approximate token budget for each page's content; lower-priority sections are left out to fit (default: 0, no limit)"
+}
+
+# Containers dropped before scoring, and class/id hints that move a block's score
+BOILERPLATE_TAGS = ("nav", "footer", "aside", "form", "button", "dialog", "menu", "noscript", "script", "style")
+BOILERPLATE_HINTS = re.compile(
+    r"banner|breadcrumb|comment|consent|cookie|footer|gdpr|menu|nav|newsletter|popup|promo|"
+    r"related|share|sidebar|social|sponsor|subscribe|widget|\bads?\b", re.IGNORECASE
+)
+CONTENT_HINTS = re.compile(r"article|body|content|entry|main|post|story|text", re.IGNORECASE)
+SCORED_TAGS = ("p", "pre", "td", "blockquote", "li", "dd")
+MIN_BLOCK_TEXT = 25
+
+# Rough token estimate, about four characters per token for English text
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def _class_weight(element) -> int:
+    """Readability-style bonus or penalty from an element's class and id"""
+    hints = f"{element.get('class', '')} {element.get('id', '')}"
+    weight = 0
+    if BOILERPLATE_HINTS.search(hints):
+        weight -= 25
+    if CONTENT_HINTS.search(hints):
+        weight += 25
+    if element.tag in ("article", "main"):
+        weight += 25
+    return weight
+
+def _link_density(element) -> float:
+    """Share of an element's text that sits inside links"""
+    text = len(element.text_content())
+    if not text:
+        return 1.0
+    return sum(len(link.text_content()) for link in element.iter("a")) / text
+
+def main_content_html(html: str) -> Optional[str]:
+    """HTML of the main article of a page, or None when no block stands out
+
+    Boilerplate containers are dropped, then every paragraph-like block with
+    enough text adds a score to its parent and half that to its grandparent,
+    from its length and commas. Candidates are weighted by their class and id
+    and scaled down by their link density; the best one is kept, together with
+    siblings that score close to it.
+    """
+    from lxml import html as lxml_html
+
+    try:
+        document = lxml_html.document_fromstring(html)
+    except Exception:
+        return None
+    for element in list(document.iter(*BOILERPLATE_TAGS, "header")):
+        # A header inside the article holds its title, one at page level holds the site menu
+        if element.tag == "header" and any(ancestor.tag in ("article", "main") for ancestor in element.iterancestors()):
+            continue
+        if element.getparent() is not None:
+            element.drop_tree()
+    for element in list(document.iter()):
+        if (isinstance(element.tag, str) and element.tag not in ("html", "body", "article", "main")
+                and element.getparent() is not None
+                and BOILERPLATE_HINTS.search(f"{element.get('class', '')} {element.get('id', '')}")
+                and not CONTENT_HINTS.search(f"{element.get('class', '')} {element.get('id', '')}")):
+            element.drop_tree()
+    
+    scores: Dict[Any, float] = {}
+    for block in document.iter(*SCORED_TAGS):
+        text = " ".join(block.text_content().split())
+        if len(text) < MIN_BLOCK_TEXT:
+            continue
+        score = 1 + text.count(",") + min(len(text) // 100, 3)
+        for share, ancestor in zip((1.0, 0.5), block.iterancestors()):
+            if ancestor not in scores:
+                scores[ancestor] = _class_weight(ancestor)
+            scores[ancestor] += score * share
+    if not scores:
+        return None
+    
+    ranked = {element: score * (1 - _link_density(element)) for element, score in scores.items()}
+    best = max(ranked, key=ranked.get)
+    if ranked[best] <= 0:
+        return None
+    # Promote a tight candidate to its article or main container
+    container = next((ancestor for ancestor in best.iterancestors() if ancestor.tag in ("article", "main")), None)
+    if container is not None:
+        best = container
+    parent = best.getparent()
+    if parent is None or best.tag == "body":
+        return lxml_html.tostring(best, encoding="unicode")
+    threshold = max(10.0, ranked.get(best, 0) * 0.2)
+    kept = []
+    for sibling in parent:
+        if sibling is best or ranked.get(sibling, 0) >= threshold:
+            kept.append(sibling)
+        elif sibling.tag == "p":
+            text = " ".join(sibling.text_content().split())
+            if len(text) > 80 and _link_density(sibling) < 0.25:
+                kept.append(sibling)
+    return "".join(lxml_html.tostring(element, encoding="unicode", with_tail=False) for element in kept)
+
+def html_to_markdown(url: str, html: str) -> str:
+    """Convert an HTML fragment with the markdown generator html_to_page uses"""
+    from crawl4ai.markdown_generation_strategy import DefaultMarkdownGenerator
+
+    return DefaultMarkdownGenerator().generate_markdown(html, base_url=url).raw_markdown
+
+def split_sections(content: str, output_format: str = "markdown") -> List[str]:
+    """Cut content before each heading; the first section is the lead"""
+    pattern = (HTML_BREAKS if output_format == "html" else MARKDOWN_BREAKS)[0]
+    starts = [0] + [match.start() for match in pattern.finditer(content) if match.start() > 0]
+    return [content[start:end] for start, end in zip(starts, starts[1:] + [len(content)])]
+
+def _section_priority(index: int, section: str) -> float:
+    """Higher for the lead and for sections of running text rather than link lists"""
+    words = len(section.split())
+    links = section.count("](") + section.lower().count("<a ")
+    return (1000.0 if index == 0 else 0.0) + words / (1 + links * 5) - index * 0.1
+
+def fit_to_budget(content: str, max_tokens: int, output_format: str = "markdown"):
+    """Keep the highest-priority sections that fit max_tokens, in page order
+
+    Sections are ranked with the lead first, then by words per link. A
+    section that does not fit is skipped in favour of smaller ones; when
+    nothing fits, the lead is cut at a paragraph. Returns the content and
+    the number of sections left out.
+    """
+    if estimate_tokens(content) <= max_tokens:
+        return content, 0
+    sections = split_sections(content, output_format)
+    order = sorted(range(len(sections)), key=lambda i: _section_priority(i, sections[i]), reverse=True)
+    budget = max_tokens
+    chosen = set()
+    for i in order:
+        cost = estimate_tokens(sections[i])
+        if cost <= budget:
+            chosen.add(i)
+            budget -= cost
+    if not chosen:
+        lead, _ = paginate(sections[order[0]], 0, max_tokens * CHARS_PER_TOKEN, output_format)
+        return lead, len(sections)
+    return "".join(sections[i] for i in sorted(chosen)), len(sections) - len(chosen)
+
+def select_content(url: str, page: Dict[str, Any], output_format: str, content: str = "full",
+                   max_tokens: int = 0):
+    """The body format_result renders, after main-content extraction and budgeting
+
+    Returns the body and a summary of what was selected, or None when the
+    whole page is returned as it is.
+    """
+    source = page["cleaned_html"]
+    if output_format == "html":
+        body = source
+    elif output_format == "text":
+        body = page_text(page)
+    else:
+        body = page["markdown"] or source
+    if content == "full" and not max_tokens:
+        return body, None
+    
+    info = {"content": content}
+    if content == "main":
+        main_html = main_content_html(source) if source else None
+        info["main_found"] = main_html is not None
+        if main_html is None:
+            pass
+        elif output_format == "html":
+            body = main_html
+        elif output_format == "text":
+            body = analyze_html(url, main_html)["text"]
+        else:
+            body = html_to_markdown(url, main_html)
+    if max_tokens:
+        body, omitted = fit_to_budget(body, max_tokens, output_format)
+        info["max_tokens"] = max_tokens
+        info["sections_omitted"] = omitted
+    info["tokens"] = estimate_tokens(body)
+    return body, info
+
+def format_result(url: str, page: Dict[str, Any], output_format: str,
+                  offset: int = 0, max_chars: int = 0, content: str = "full", max_tokens: int = 0) -> str:
+    """Render a crawled page in the requested output format
+
+    content="main" keeps only the main article and max_tokens trims the
+    result to a token budget. With max_chars set, only the chunk starting at
+    offset is rendered, followed by a note telling the caller which offset
+    to request next. An offset past the end raises OffsetError.
+    """
+    body, selection = select_content(url, page, output_format, content, max_tokens)
+    total = len(body)
+    
+    next_offset = None
+    if max_chars or offset:
+        if offset > len(body):
+            raise OffsetError(f"Error: offset {offset} is past the end of the content ({len(body)} characters)")
+        body, next_offset = paginate(body, offset, max_chars or len(body), output_format)
+    
+    if output_format == "json":
+        data = {
+            "url": url,
+            "title": page["title"],
+            "content": body,
+            "metadata": dict(status_code=page["status_code"], **page_counts(page))
+        }
+        if selection:
+            data["selection"] = selection
+        if max_chars or offset:
+            data["pagination"] = {
+                "offset": offset,
+                "next_offset": next_offset,
+                "total_chars": total
+            }
+        return json.dumps(data, indent=2)
+    
+    if selection and selection.get("sections_omitted"):
+        body = body.rstrip() + (f"\n\n---\n[{selection['sections_omitted']} lower-priority section(s) left out "
+                                f"to fit max_tokens={max_tokens}.]")
+    if next_offset is not None:
+        body = body.rstrip() + (f"\n\n---\n[Showing characters {offset}-{next_offset} of {total}. "
+                 f"Call crawl_url again with offset={next_offset} for the next part.]")
+    return body
+
+async def _report(progress: Optional[ProgressCallback], done: float, total: Optional[float] = None,
+                  message: Optional[str] = None):
+    """Send a progress update if the caller asked for them"""
+    if progress is None:
+        return
+    try:
+        await progress(done, total, message)
+    except Exception as e:
+        logger.warning(f"Failed to send progress notification: {e}")
+
+def crawl_options(arguments: Dict[str, Any]):
+    """Validate the crawl arguments shared by the crawling tools
+
+    Returns the fetch_page keyword arguments and an error message or None.
+    """
+    options = {
+        "cache_mode": arguments.get("cache_mode", "use"),
+        "render": arguments.get("render", DEFAULT_RENDER),
+        "network_profile": arguments.get("network_profile", DEFAULT_NETWORK_PROFILE),
+        "wait_for": arguments.get("wait_for", DEFAULT_WAIT_FOR),
+    }
+    if options["cache_mode"] not in CACHE_MODES:
+        return options, f"Error: Invalid cache mode: {options['cache_mode']}"
+    if options["render"] not in RENDER_MODES:
+        return options, f"Error: Invalid render mode: {options['render']}"
+    if options["network_profile"] not in NETWORK_PROFILES:
+        return options, f"Error: Invalid network profile: {options['network_profile']}"
+    error = validate_wait_for(options["wait_for"])
+    if error:
+        return options, error
+    options["timeout_ms"] = int(arguments.get("timeout_ms", DEFAULT_TIMEOUT_MS))
+    if options["timeout_ms"] < 1000:
+        return options, "Error: timeout_ms must be at least 1000"
+    return options, None
+
+def format_options(arguments: Dict[str, Any]):
+    """Validate the content selection arguments shared by the crawling tools
+
+    Returns the content and max_tokens arguments of format_result and an
+    error message or None.
+    """
+    content = arguments.get("content", DEFAULT_CONTENT)
+    max_tokens = int(arguments.get("max_tokens", 0) or 0)
+    if content not in CONTENT_MODES:
+        return (content, max_tokens), f"Error: Invalid content mode: {content}"
+    if max_tokens < 0:
+        return (content, max_tokens), "Error: max_tokens must not be negative"
+    return (content, max_tokens), None
+
+async def crawl_url_handler(arguments: Dict[str, Any], progress: Optional[ProgressCallback] = None):
+    """Handle crawl_url tool calls"""
+    try:
+        url = arguments.get("url")
+        error = validate_url(url)
+        if error:
+            return [{"type": "text", "text": error}]
+        
+        output_format = arguments.get("output_format", "markdown")
+        if output_format not in OUTPUT_FORMATS:
+            return [{"type": "text", "text": f"Error: Invalid output format: {output_format}"}]
+        
+        options, error = crawl_options(arguments)
+        if error:
+            return [{"type": "text", "text": error}]
+        formatting, error = format_options(arguments)
+        if error:
+            return [{"type": "text", "text": error}]
+        retrying, error = retry_options(arguments)
+        if error:
+            return [{"type": "text", "text": error}]
+        
+        max_chars = int(arguments.get("max_chars", DEFAULT_MAX_CHARS) or 0)
+        offset = int(arguments.get("offset", 0) or 0)
+        if max_chars < 0 or offset < 0:
+            return [{"type": "text", "text": "Error: max_chars and offset must not be negative"}]
+        
+        await _report(progress, 0, 2, f"Fetching {url}")
+        page, _ = await fetch_with_retries(url, **retrying, **options)
+        await _report(progress, 1, 2, f"Formatting {url}")
+        with timed("serialization"):
+            try:
+                content = await offload(format_result, url, page, output_format, offset, max_chars, *formatting,
+                                        size=page_size(page))
+            except OffsetError as e:
+                return [{"type": "text", "text": str(e)}]
+        await _report(progress, 2, 2)
+        
+        logger.info(f"Successfully crawled {url} with {output_format} format")
+        return [{"type": "text", "text": content}]
+        
+    except CrawlError as e:
+        logger.error(str(e))
+        return [{"type": "text", "text": str(e)}]
+    except Exception as e:
+        error_msg = f"Exception while crawling {url}: {str(e)}"
+        logger.error(error_msg)
+        return [{"type": "text", "text": error_msg}]
+
+METADATA_MODES = ["auto", "fast", "browser"]
+
+# Stop reading a page once this much has arrived without a closing </head>
+HEAD_MAX_BYTES = 256 * 1024
+
+def parse_head(url: str, head_html: bytes) -> Dict[str, Any]:
+    """Extract title, language and meta tags from the <head> of a page"""
+    from lxml import html as lxml_html
+
+    metadata: Dict[str, Any] = {"title": '', "language": '', "description": '', "canonical": '', "meta": {}}
+    if not head_html.strip():
+        return metadata
+    try:
+        document = lxml_html.document_fromstring(head_html)
+    except Exception as e:
+        logger.warning(f"Could not parse <head> of {url}: {e}")
+        return metadata
+    
+    title = document.find(".//title")
+    if title is not None and title.text:
+        metadata["title"] = " ".join(title.text.split())
+    metadata["language"] = document.get("lang") or document.get("xml:lang") or ''
+    for meta in document.iter("meta"):
+        name = (meta.get("name") or meta.get("property") or meta.get("http-equiv") or '').strip().lower()
+        content = meta.get("content")
+        if not name or content is None:
+            continue
+        metadata["meta"][name] = content.strip()
+        if name == "description":
+            metadata["description"] = content.strip()
+        elif name == "content-language" and not metadata["language"]:
+            metadata["language"] = content.strip()
+    for link in document.iter("link"):
+        if "canonical" in (link.get("rel") or '').lower().split() and link.get("href"):
+            metadata["canonical"] = link.get("href")
+            break
+    return metadata
+
+async def fetch_head_metadata(url: str) -> Dict[str, Any]:
+    """Get page metadata from response headers and the <head> only
+
+    Sends a HEAD request first so non-HTML resources never have their body
+    downloaded, then streams a GET and stops reading at </head>.
+    """
+    session = await get_http_session()
+    host = urlparse(url).netloc.lower()
+    metadata: Dict[str, Any] = {"url": url}
+    
+    content_type = ''
+    try:
+        async with host_limiter.slot(host), session.head(url, allow_redirects=True) as response:
+            host_limiter.record(host, response.status, parse_retry_after(response.headers.get("Retry-After")))
+            if response.status < 400:
+                content_type = response.headers.get("Content-Type", '')
+                metadata.update({
+                    "final_url": str(response.url),
+                    "status_code": response.status,
+                    "content_type": content_type,
+                    "content_length": response.headers.get("Content-Length"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                })
+    except Exception as e:
+        # Some servers reject or mishandle HEAD; the GET below still works
+        logger.info(f"HEAD request failed for {url}: {e}")
+    
+    if content_type and "html" not in content_type.lower():
+        metadata.update(parse_head(url, b''))
+        return metadata
+    
+    head = bytearray()
+    async with host_limiter.slot(host), session.get(url, headers={"Range": f"bytes=0-{HEAD_MAX_BYTES - 1}"}) as response:
+        host_limiter.record(host, response.status, parse_retry_after(response.headers.get("Retry-After")))
+        if response.status >= 400:
+            raise CrawlError(f"Failed to crawl {url}: HTTP {response.status}")
+        metadata.update({
+            "final_url": str(response.url),
+            "status_code": 200 if response.status == 206 else response.status,
+            "content_type": response.headers.get("Content-Type", ''),
+            "last_modified": response.headers.get("Last-Modified"),
+        })
+        metadata.setdefault("content_length", response.headers.get("Content-Length"))
+        async for chunk in response.content.iter_chunked(16384):
+            head.extend(chunk)
+            end = head.lower().find(b"</head>")
+            if end != -1:
+                del head[end + len(b"</head>"):]
+                break
+            if len(head) >= HEAD_MAX_BYTES:
+                break
+        # Drop the rest of the body instead of draining it
+        response.close()
+    
+    metadata.update(parse_head(url, bytes(head)))
+    metadata["needs_javascript"] = not metadata["title"]
+    return metadata
+
+async def get_metadata_handler(arguments: Dict[str, Any], progress: Optional[ProgressCallback] = None):
+    """Handle get_metadata tool calls"""
+    try:
+        url = arguments.get("url")
+        error = validate_url(url)
+        if error:
+            return [{"type": "text", "text": error}]
+        
+        cache_mode = arguments.get("cache_mode", "use")
+        if cache_mode not in CACHE_MODES:
+            return [{"type": "text", "text": f"Error: Invalid cache mode: {cache_mode}"}]
+        
+        mode = arguments.get("mode", "auto")
+        if mode not in METADATA_MODES:
+            return [{"type": "text", "text": f"Error: Invalid mode: {mode}"}]
+        
+        network_profile = arguments.get("network_profile", DEFAULT_NETWORK_PROFILE)
+        if network_profile not in NETWORK_PROFILES:
+            return [{"type": "text", "text": f"Error: Invalid network profile: {network_profile}"}]
+        
+        page = recent_pages.get(url) if cache_mode == "use" else None
+        source = "recent" if page is not None else "browser"
+        if page is not None:
+            logger.info(f"Reusing page crawled moments ago for metadata of {url}")
+        elif mode != "browser":
+            try:
+                metadata = await fetch_head_metadata(url)
+                if mode == "fast" or not metadata.pop("needs_javascript", False):
+                    metadata["source"] = "http"
+                    logger.info(f"Successfully extracted metadata for {url} without the browser")
+                    return [{"type": "text", "text": json.dumps(metadata, indent=2)}]
+                logger.info(f"No title in static <head> of {url}, falling back to the browser")
+            except Exception as e:
+                if mode == "fast":
+                    raise
+                logger.info(f"Fast metadata fetch failed for {url}, falling back to the browser: {e}")
+        
+        if page is None:
+            page = await fetch_page(url, cache_mode=cache_mode, network_profile=network_profile)
+        
+        # Extract metadata
+        metadata = {
+            "url": url,
+            "title": page["title"],
+            **page_counts(page),
+            "status_code": page["status_code"],
+            "language": page["language"],
+            "headings": page["outline"],
+            "source": source
+        }
+        
+        logger.info(f"Successfully extracted metadata for {url}")
+        with timed("serialization"):
+            return [{"type": "text", "text": json.dumps(metadata, indent=2)}]
+        
+    except CrawlError as e:
+        logger.error(str(e))
+        return [{"type": "text", "text": str(e)}]
+    except Exception as e:
+        error_msg = f"Exception while getting metadata for {url}: {str(e)}"
+        logger.error(error_msg)
+        return [{"type": "text", "text": error_msg}]
+
+class HostLimiter:
+    """Process-wide token bucket per host that slows down when the host pushes back
+
+    Every host is limited to HOST_MAX_CONCURRENCY requests at once across
+    all tool calls, and otherwise starts unthrottled. A 429 or 503 halves
+    the host's rate (from HOST_THROTTLED_RATE the first time) and
+    Retry-After blocks it until then. Every success raises the rate by
+    HOST_RECOVERY until it passes HOST_MAX_RATE and the host is unthrottled again.
+    """
+
+    def __init__(self):
+        self._hosts: Dict[str, Dict[str, float]] = {}
+        # Semaphore and number of holders and waiters, dropped when nobody uses it
+        self._active: Dict[str, list] = {}
+
+    @asynccontextmanager
+    async def slot(self, host: str):
+        """Hold one of the host's concurrent request slots, then wait for a token if throttled"""
+        entry = self._active.setdefault(host, [asyncio.Semaphore(max(1, HOST_MAX_CONCURRENCY)), 0])
+        entry[1] += 1
+        try:
+            async with acquire_timed(entry[0]):
+                await self.acquire(host)
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._active[host]
+
+    async def acquire(self, host: str):
+        """Wait for a token of a throttled host; unthrottled hosts pass at once"""
+        loop = asyncio.get_event_loop()
+        while host in self._hosts:
+            state = self._hosts[host]
+            now = loop.time()
+            state["tokens"] = min(1.0, state["tokens"] + (now - state["updated"]) * state["rate"])
+            state["updated"] = now
+            wait = state["blocked_until"] - now
+            if wait <= 0:
+                if state["tokens"] >= 1:
+                    state["tokens"] -= 1
+                    return
+                wait = (1 - state["tokens"]) / state["rate"]
+            with timed("throttle_wait"):
+                await asyncio.sleep(wait)
+
+    def throttled(self, host: str, retry_after: Optional[float] = None):
+        """Halve a host's rate after a 429 or 503 and honour its Retry-After"""
+        now = asyncio.get_event_loop().time()
+        state = self._hosts.setdefault(host, {"rate": HOST_THROTTLED_RATE * 2, "tokens": 0.0,
+                                              "updated": now, "blocked_until": 0.0})
+        state["rate"] = max(HOST_MIN_RATE, state["rate"] / 2)
+        state["tokens"] = 0.0
+        if retry_after:
+            state["blocked_until"] = max(state["blocked_until"], now + min(retry_after, RETRY_MAX_DELAY))
+        stats.count("host_throttles")
+        logger.info(f"Throttling {host} to {state['rate']:.2f} requests/s")
+
+    def succeeded(self, host: str):
+        """Speed a throttled host back up after a successful request"""
+        state = self._hosts.get(host)
+        if state is None:
+            return
+        state["rate"] *= HOST_RECOVERY
+        if state["rate"] > HOST_MAX_RATE:
+            del self._hosts[host]
+
+    def record(self, host: str, status: int, retry_after: Optional[float] = None):
+        """Throttle or speed up a host according to the status of its response"""
+        if status in THROTTLE_STATUSES:
+            self.throttled(host, retry_after)
+        elif status < 500:
+            self.succeeded(host)
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = asyncio.get_event_loop().time()
+        return {host: {"requests_per_second": round(state["rate"], 3),
+                       "blocked_for_seconds": round(max(0.0, state["blocked_until"] - now), 1)}
+                for host, state in sorted(self._hosts.items())}
+
+# Global per-host limiter, shared by every tool call
+host_limiter = HostLimiter()
+
+class HostScheduler:
+    """Per-host concurrency limit and minimum delay between request starts"""
+
+    def __init__(self, per_host_limit: int = BATCH_PER_HOST_LIMIT,
+                 per_host_delay: float = BATCH_PER_HOST_DELAY):
+        self.per_host_limit = max(1, per_host_limit)
+        self.per_host_delay = max(0.0, per_host_delay)
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._next_start: Dict[str, float] = {}
+
+    @asynccontextmanager
+    async def slot(self, url: str):
+        """Wait until a request to url's host may start"""
+        host = urlparse(url).netloc.lower()
+        semaphore = self._semaphores.setdefault(host, asyncio.Semaphore(self.per_host_limit))
+        async with acquire_timed(semaphore):
+            with timed("queue_wait"):
+                await self._throttle(host)
+            async with host_limiter.slot(host):
+                yield
+
+    async def _throttle(self, host: str):
+        """Sleep until the per-host delay since the previous start has passed"""
+        async with self._locks.setdefault(host, asyncio.Lock()):
+            loop = asyncio.get_event_loop()
+            wait = self._next_start.get(host, 0.0) - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._next_start[host] = loop.time() + self.per_host_delay
 
-async def get_crawler(config: Dict[str, Any] = None):
-    """Get or create a crawler instance"""
-    # Import Crawl4AI when needed
-    try:
-        from crawl4ai import AsyncWebCrawler, BrowserConfig, CrawlerRunConfig
-    except ImportError as e:
-        logger.error(f"Failed to import crawl4ai: {e}")
-        raise RuntimeError("Crawl4AI is not installed. Please install it with: pip install crawl4ai")
-    
-    global crawler
-    if crawler is None:
+    async def fetch(self, url: str, **options):
+        """fetch_with_retries, loading pages in this scheduler's host slots"""
+        return await fetch_with_retries(url, scheduler=self, **options)
+
+async def fetch_with_retries(url: str, retries: int = DEFAULT_RETRIES, backoff: float = RETRY_BACKOFF,
+                             **options):
+    """fetch_page, retrying transient failures
+
+    Timeouts, connection errors, 429 and 5xx responses are retried after
+    backoff * 2^attempt seconds with +-50% jitter, or after Retry-After
+    when the host sends a longer one. A Retry-After beyond RETRY_MAX_DELAY
+    is not waited for. Host slots and limit are released while waiting.
+    The timeout_ms option is one deadline for all attempts, starting when
+    the first one leaves the queue: later attempts get what is left of it,
+    and a retry that could not get RETRY_MIN_ATTEMPT_MS is not made.
+    Returns the page, the last one on persistent 5xx, and the queue and
+    fetch times in milliseconds summed over all attempts.
+    """
+    timeout_ms = options.pop("timeout_ms", DEFAULT_TIMEOUT_MS)
+    deadline = None
+    timings = {"queue_ms": 0.0, "fetch_ms": 0.0}
+    for attempt in range(retries + 1):
+        retry_after = error = None
+        attempt_timings: Dict[str, float] = {}
+        called, began = time.perf_counter(), time.monotonic()
         try:
-            with StdoutRedirect():  # Suppress crawler initialization output
-                browser_config = BrowserConfig(
-                    headless=config.get("headless", True) if config else True,
-                    user_agent="Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-                    viewport={"width": 1920, "height": 1080},
-                    extra_args=["--disable-dev-shm-usage", "--no-sandbox"]
-                )
-                crawler = AsyncWebCrawler(config=browser_config)
-                # Warm up the crawler if the method exists
-                if hasattr(crawler, 'awarmup'):
-                    await crawler.awarmup()
-                logger.info("Crawler instance created successfully")
+            page = await fetch_page(url, timeout_ms=timeout_ms, deadline=deadline, timings=attempt_timings, **options)
         except Exception as e:
-            logger.error(f"Failed to create crawler: {e}")
-            raise
-    return crawler
+            if attempt == retries or not is_transient(e):
+                raise
+            error, reason = e, str(e)
+        else:
+            status = page["status_code"]
+            retry_after = page.get("retry_after")
+            if (status < 500 and status != 429) or attempt == retries or (retry_after or 0) > RETRY_MAX_DELAY:
+                return page, timings
+            reason = f"HTTP {status}"
+        finally:
+            queue_ms = attempt_timings.get("queue_ms", 0.0)
+            timings["queue_ms"] = round(timings["queue_ms"] + queue_ms, 1)
+            timings["fetch_ms"] = round(timings["fetch_ms"] + (time.perf_counter() - called) * 1000 - queue_ms, 1)
+            if deadline is None:
+                deadline = attempt_timings.get("started", began) + timeout_ms / 1000
+        delay = min(RETRY_MAX_DELAY, max(retry_after or 0, backoff * 2 ** attempt * random.uniform(0.5, 1.5)))
+        if time.monotonic() + delay + RETRY_MIN_ATTEMPT_MS / 1000 > deadline:
+            logger.info(f"Not retrying {url} after {reason}: no time left within {timeout_ms} ms")
+            if error is not None:
+                raise error
+            return page, timings
+        logger.info(f"Retrying {url} in {delay:.1f} s after {reason} (attempt {attempt + 2} of {retries + 1})")
+        stats.count("retries")
+        with timed("retry_wait"):
+            await asyncio.sleep(delay)
 
-async def cleanup():
-    """Cleanup crawler instance"""
-    global crawler
-    if crawler:
+def retry_options(arguments: Dict[str, Any]):
+    """Validate the retry arguments shared by the crawling tools
+
+    Returns the fetch_with_retries keyword arguments and an error message or None.
+    """
+    options = {
+        "retries": int(arguments.get("retries", DEFAULT_RETRIES)),
+        "backoff": float(arguments.get("retry_backoff", RETRY_BACKOFF)),
+    }
+    if not 0 <= options["retries"] <= 10:
+        return options, "Error: retries must be between 0 and 10"
+    if options["backoff"] < 0:
+        return options, "Error: retry_backoff must not be negative"
+    return options, None
+
+# Bulk export of crawl results to disk
+EXPORT_DIR = os.environ.get("CRAWL4AI_EXPORT_DIR") or os.path.join(CACHE_DIR, "exports")
+EXPORT_FORMATS = ["jsonl", "jsonl.gz", "jsonl.zst", "parquet"]
+EXPORT_DEFAULT_FORMAT = "jsonl.gz"
+EXPORT_ROW_GROUP = 256
+
+EXPORT_SCHEMA = {
+    "type": "object",
+    "description": "Stream results to a file instead of returning them; the response then holds only the path and summary",
+    "properties": {
+        "path": {
+            "type": "string",
+            "description": "File to write, relative to CRAWL4AI_EXPORT_DIR; paths outside it are refused"
+        },
+        "format": {
+            "type": "string",
+            "enum": EXPORT_FORMATS,
+            "description": f"File format (default: taken from the path's extension, else {EXPORT_DEFAULT_FORMAT})"
+        },
+        "overwrite": {
+            "type": "boolean",
+            "description": "Replace the file if it already exists (default: false)"
+        }
+    },
+    "required": ["path"]
+}
+
+def export_record(url: str, page: Optional[Dict[str, Any]] = None, error: Optional[str] = None,
+                  timings: Optional[Dict[str, float]] = None, depth: Optional[int] = None) -> Dict[str, Any]:
+    """One row of an export file; failed crawls keep their error and leave the page fields empty"""
+    page = page or {}
+    return {
+        "url": url,
+        "success": error is None,
+        "error": error,
+        "status_code": page.get("status_code"),
+        "title": page.get("title"),
+        "markdown": page.get("markdown"),
+        "links": page.get("links"),
+        "media": page.get("media"),
+        "depth": depth,
+        "timings": dict({"queue_ms": None, "fetch_ms": None}, **(timings or {})),
+    }
+
+class ExportWriter:
+    """Stream export records to JSONL, optionally gzip or zstd compressed, or to Parquet
+
+    Records go to a temporary file that replaces path on close, so a crawl
+    that fails midway never leaves a truncated export behind.
+    """
+
+    def __init__(self, path: str, export_format: str = EXPORT_DEFAULT_FORMAT):
+        self.path = path
+        self.format = export_format
+        self.records = 0
+        # Unique per writer, so concurrent exports to one path cannot share a temporary file
+        self._temp = f"{path}.{uuid.uuid4().hex}.part"
+        self._lock = threading.Lock()
+        self._rows: List[Dict[str, Any]] = []
+        self._stream = None
+        self._parquet = None
+        self._closed = False
+        if export_format == "parquet":
+            try:
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError:
+                raise RuntimeError("pyarrow is not installed. Please install it with: pip install pyarrow")
+            # links and media nest differently from page to page, so they are stored as JSON text
+            self._schema = pyarrow.schema([
+                ("url", pyarrow.string()),
+                ("success", pyarrow.bool_()),
+                ("error", pyarrow.string()),
+                ("status_code", pyarrow.int32()),
+                ("title", pyarrow.string()),
+                ("markdown", pyarrow.string()),
+                ("links", pyarrow.string()),
+                ("media", pyarrow.string()),
+                ("depth", pyarrow.int32()),
+                ("timings", pyarrow.struct([("queue_ms", pyarrow.float64()), ("fetch_ms", pyarrow.float64())])),
+            ])
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._parquet = pyarrow.parquet.ParquetWriter(self._temp, self._schema, compression="zstd")
+            return
+        if export_format == "jsonl.zst":
+            try:
+                import zstandard
+            except ImportError:
+                raise RuntimeError("zstandard is not installed. Please install it with: pip install zstandard")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._raw = open(self._temp, "wb")
+        if export_format == "jsonl.gz":
+            self._stream = gzip.GzipFile(filename='', mode="wb", compresslevel=6, fileobj=self._raw)
+        elif export_format == "jsonl.zst":
+            self._stream = zstandard.ZstdCompressor(level=3).stream_writer(self._raw, closefd=False)
+        else:
+            self._stream = self._raw
+
+    def write(self, record: Dict[str, Any]):
+        """Append one record; Parquet rows are buffered into row groups of EXPORT_ROW_GROUP"""
+        with self._lock:
+            if self._parquet is not None:
+                record = dict(record, **{name: json.dumps(record[name]) for name in ("links", "media")
+                                          if record[name] is not None})
+                self._rows.append(record)
+                if len(self._rows) >= EXPORT_ROW_GROUP:
+                    self._flush_rows()
+            else:
+                self._stream.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+            self.records += 1
+
+    def _flush_rows(self):
+        import pyarrow
+
+        if self._rows:
+            self._parquet.write_table(pyarrow.Table.from_pylist(self._rows, schema=self._schema))
+            self._rows = []
+
+    def close(self) -> Dict[str, Any]:
+        """Finish the file, move it into place and return what was written"""
+        with self._lock:
+            if self._parquet is not None:
+                self._flush_rows()
+                self._parquet.close()
+            else:
+                if self._stream is not self._raw:
+                    self._stream.close()
+                self._raw.close()
+            os.replace(self._temp, self.path)
+            self._closed = True
+        return {"path": self.path, "format": self.format, "records": self.records,
+                "bytes": os.path.getsize(self.path)}
+
+    def discard(self):
+        """Drop the temporary file of an export that was not closed"""
+        if self._closed:
+            return
+        self._closed = True
         try:
-            await crawler.close()
-            logger.info("Crawler instance closed")
+            if self._parquet is not None:
+                self._parquet.close()
+            else:
+                self._raw.close()
+            os.remove(self._temp)
         except Exception as e:
-            logger.error(f"Error closing crawler: {e}")
-        finally:
-            crawler = None
+            logger.warning(f"Could not remove partial export {self._temp}: {e}")
 
-async def crawl_url_handler(arguments: Dict[str, Any]):
-    """Handle crawl_url tool calls"""
+    async def awrite(self, record: Dict[str, Any]):
+        """write() without blocking the event loop"""
+        await asyncio.get_event_loop().run_in_executor(None, self.write, record)
+
+    async def aclose(self) -> Dict[str, Any]:
+        """close() without blocking the event loop"""
+        return await asyncio.get_event_loop().run_in_executor(None, self.close)
+
+def open_export(export: Any):
+    """Validate an export argument and open its writer
+
+    Returns the ExportWriter and an error message or None.
+    """
+    if not isinstance(export, dict) or not isinstance(export.get("path"), str) or not export["path"]:
+        return None, "Error: export must be an object with a path"
+    # Tool calls may only write inside the export directory, symlinks included
+    root = os.path.realpath(EXPORT_DIR)
+    path = os.path.realpath(os.path.join(root, export["path"]))
+    if os.path.isabs(export["path"]) or path == root or os.path.commonpath([root, path]) != root:
+        return None, f"Error: export path must be a file inside {EXPORT_DIR}: {export['path']}"
+    if os.path.exists(path) and not export.get("overwrite"):
+        return None, f"Error: {path} already exists; set overwrite to replace it"
+    export_format = export.get("format") or next(
+        (name for name in sorted(EXPORT_FORMATS, key=len, reverse=True) if path.endswith("." + name)),
+        EXPORT_DEFAULT_FORMAT
+    )
+    if export_format not in EXPORT_FORMATS:
+        return None, f"Error: Invalid export format: {export_format}"
     try:
-        url = arguments.get("url")
-        if not url:
-            return [{"type": "text", "text": "Error: URL is required"}]
+        return ExportWriter(path, export_format), None
+    except (RuntimeError, OSError) as e:
+        return None, f"Error: Cannot export to {path}: {e}"
+
+async def crawl_batch_handler(arguments: Dict[str, Any], progress: Optional[ProgressCallback] = None):
+    """Handle crawl_batch tool calls"""
+    writer = None
+    try:
+        urls = arguments.get("urls")
+        if not urls or not isinstance(urls, list):
+            return [{"type": "text", "text": "Error: urls must be a non-empty list"}]
+        if len(urls) > BATCH_MAX_URLS:
+            return [{"type": "text", "text": f"Error: At most {BATCH_MAX_URLS} URLs per batch"}]
         
-        # Validate URL
-        parsed = urlparse(url)
-        if not parsed.scheme or not parsed.netloc:
-            return [{"type": "text", "text": f"Error: Invalid URL format: {url}"}]
+        output_format = arguments.get("output_format", "markdown")
+        if output_format not in OUTPUT_FORMATS:
+            return [{"type": "text", "text": f"Error: Invalid output format: {output_format}"}]
+        
+        options, error = crawl_options(arguments)
+        if error:
+            return [{"type": "text", "text": error}]
+        formatting, error = format_options(arguments)
+        if error:
+            return [{"type": "text", "text": error}]
+        retrying, error = retry_options(arguments)
+        if error:
+            return [{"type": "text", "text": error}]
+        
+        if arguments.get("export") is not None:
+            writer, error = open_export(arguments["export"])
+            if error:
+                return [{"type": "text", "text": error}]
+        
+        max_concurrency = int(arguments.get("max_concurrency", get_crawler_pool().size))
+        scheduler = HostScheduler(
+            per_host_limit=int(arguments.get("per_host_limit", BATCH_PER_HOST_LIMIT)),
+            per_host_delay=float(arguments.get("per_host_delay", BATCH_PER_HOST_DELAY)),
+        )
+        limit = asyncio.Semaphore(max(1, max_concurrency))
+        
+        async def failed(url: Any, error: str) -> Dict[str, Any]:
+            if writer:
+                await writer.awrite(export_record(str(url), error=error))
+            return {"url": url, "success": False, "error": error}
+        
+        async def crawl_one(url: Any) -> Dict[str, Any]:
+            error = validate_url(url) if isinstance(url, str) else "Error: URL must be a string"
+            if error:
+                return await failed(url, error)
+            try:
+                page, timings = await scheduler.fetch(url, limit=limit, **retrying, **options)
+                if writer:
+                    await writer.awrite(export_record(url, page, timings=timings))
+                    return {"url": url, "success": True}
+                with timed("serialization"):
+                    content = await offload(format_result, url, page, output_format, 0, 0, *formatting,
+                                            size=page_size(page))
+                    return {"url": url, "success": True, "content": content}
+            except CrawlError as e:
+                logger.error(str(e))
+                return await failed(url, str(e))
+            except Exception as e:
+                error_msg = f"Exception while crawling {url}: {str(e)}"
+                logger.error(error_msg)
+                return await failed(url, error_msg)
+        
+        finished = 0
+        
+        async def crawl_and_report(url: Any) -> Dict[str, Any]:
+            nonlocal finished
+            item = await crawl_one(url)
+            finished += 1
+            await _report(progress, finished, len(urls), f"Crawled {url}")
+            return item
+        
+        await _report(progress, 0, len(urls))
+        results = await asyncio.gather(*(crawl_and_report(url) for url in urls))
+        succeeded = sum(1 for item in results if item["success"])
+        summary = {"total": len(urls), "succeeded": succeeded, "failed": len(urls) - succeeded}
+        
+        logger.info(f"Batch crawled {succeeded}/{len(urls)} URLs with {output_format} format")
+        if writer:
+            exported = await writer.aclose()
+            logger.info(f"Exported {exported['records']} records to {exported['path']}")
+            return [{"type": "text", "text": to_json({
+                "summary": summary,
+                "export": exported,
+                "errors": [item for item in results if not item["success"]]
+            })}]
+        with timed("serialization"):
+            size = sum(len(item.get("content", '')) for item in results)
+            return [{"type": "text", "text": await offload(to_json, {
+                "summary": summary,
+                "results": results
+            }, size=size)}]
+        
+    except Exception as e:
+        error_msg = f"Exception while batch crawling: {str(e)}"
+        logger.error(error_msg)
+        return [{"type": "text", "text": error_msg}]
+    finally:
+        if writer:
+            writer.discard()
+
+# Site crawl limits
+SITE_MAX_PAGES = _env_int("CRAWL4AI_SITE_MAX_PAGES", 500)
+SITE_DEFAULT_PAGES = 50
+SITE_DEFAULT_DEPTH = 2
+
+# Links to these files are never queued by crawl_site
+SKIPPED_EXTENSIONS = re.compile(
+    r"\.(?:7z|avi|bmp|css|csv|docx?|eot|exe|gif|gz|ico|jpe?g|js|json|mov|mp3|mp4|ogg|otf|pdf|png|pptx?|rar|"
+    r"svg|tar|tiff?|ttf|wav|webm|webp|woff2?|xlsx?|xml|zip)$",
+    re.IGNORECASE
+)
+
+# Parsed robots.txt files by origin, kept for ROBOTS_TTL seconds
+ROBOTS_TTL = 3600
+robots_files: Dict[str, tuple] = {}
+
+async def fetch_robots(url: str):
+    """Return the parsed robots.txt that governs url
+
+    Per RFC 9309, a missing robots.txt (4xx) allows everything, while a
+    server error or an unreachable host disallows everything.
+    """
+    from urllib.robotparser import RobotFileParser
+
+    parsed = urlparse(url)
+    origin = f"{parsed.scheme}://{parsed.netloc}"
+    cached = robots_files.get(origin)
+    if cached is not None and cached[0] > time.monotonic():
+        return cached[1]
+    robots = RobotFileParser(f"{origin}/robots.txt")
+    try:
+        host = parsed.netloc.lower()
+        session = await get_http_session()
+        async with host_limiter.slot(host), session.get(robots.url) as response:
+            host_limiter.record(host, response.status, parse_retry_after(response.headers.get("Retry-After")))
+            if response.status >= 500:
+                robots.disallow_all = True
+            elif response.status >= 400:
+                robots.allow_all = True
+            else:
+                robots.parse((await response.text(errors="replace")).splitlines())
+    except Exception as e:
+        logger.info(f"Could not fetch {robots.url}, treating the site as disallowed: {e}")
+        robots.disallow_all = True
+    robots_files[origin] = (time.monotonic() + ROBOTS_TTL, robots)
+    return robots
+
+def page_links(page: Dict[str, Any]) -> List[str]:
+    """Absolute http(s) URLs of the internal and external links on a page"""
+    links = []
+    for group in ("internal", "external"):
+        for link in (page.get("links") or {}).get(group, []):
+            href = link.get("href") if isinstance(link, dict) else link
+            if href:
+                absolute = urljoin(page["url"], href)
+                if urlparse(absolute).scheme in ("http", "https"):
+                    links.append(absolute)
+    return links
+
+def _site_host(url: str) -> str:
+    host = (urlparse(url).hostname or '').lower()
+    return host[4:] if host.startswith("www.") else host
+
+async def crawl_site_handler(arguments: Dict[str, Any], progress: Optional[ProgressCallback] = None):
+    """Handle crawl_site tool calls"""
+    writer = None
+    try:
+        seed = arguments.get("url")
+        error = validate_url(seed)
+        if error:
+            return [{"type": "text", "text": error}]
         
         output_format = arguments.get("output_format", "markdown")
-        if output_format not in ["markdown", "html", "text", "json"]:
+        if output_format not in OUTPUT_FORMATS:
             return [{"type": "text", "text": f"Error: Invalid output format: {output_format}"}]
         
-        # Get crawler instance
-        crawler_instance = await get_crawler()
+        options, error = crawl_options(arguments)
+        if error:
+            return [{"type": "text", "text": error}]
+        formatting, error = format_options(arguments)
+        if error:
+            return [{"type": "text", "text": error}]
+        retrying, error = retry_options(arguments)
+        if error:
+            return [{"type": "text", "text": error}]
         
-        # Suppress all Crawl4AI output during crawling
-        with StdoutRedirect():
-            result = await crawler_instance.arun(url=url)
+        max_pages = int(arguments.get("max_pages", SITE_DEFAULT_PAGES))
+        max_depth = int(arguments.get("max_depth", SITE_DEFAULT_DEPTH))
+        if not 1 <= max_pages <= SITE_MAX_PAGES:
+            return [{"type": "text", "text": f"Error: max_pages must be between 1 and {SITE_MAX_PAGES}"}]
+        if max_depth < 0:
+            return [{"type": "text", "text": "Error: max_depth must not be negative"}]
         
-        if not result.success:
-            error_msg = f"Failed to crawl {url}: {result.error_message if hasattr(result, 'error_message') else 'Unknown error'}"
-            logger.error(error_msg)
-            return [{"type": "text", "text": error_msg}]
+        try:
+            include = [re.compile(pattern) for pattern in arguments.get("include_patterns") or []]
+            exclude = [re.compile(pattern) for pattern in arguments.get("exclude_patterns") or []]
+        except re.error as e:
+            return [{"type": "text", "text": f"Error: Invalid pattern: {e}"}]
+        if arguments.get("export") is not None:
+            writer, error = open_export(arguments["export"])
+            if error:
+                return [{"type": "text", "text": error}]
+        same_domain = bool(arguments.get("same_domain", True))
+        respect_robots = bool(arguments.get("respect_robots", True))
+        seed_host = _site_host(seed)
         
-        # Format output based on requested format
-        if output_format == "markdown":
-            content = result.markdown if hasattr(result, 'markdown') and result.markdown else result.cleaned_html
-        elif output_format == "html":
-            content = result.cleaned_html if hasattr(result, 'cleaned_html') else result.html
-        elif output_format == "text":
-            content = result.cleaned_html if hasattr(result, 'cleaned_html') else result.html
-        elif output_format == "json":
-            content = json.dumps({
-                "url": url,
-                "title": getattr(result, 'title', ''),
-                "content": result.markdown if hasattr(result, 'markdown') and result.markdown else result.cleaned_html,
-                "metadata": {
-                    "status_code": getattr(result, 'status_code', 200),
-                    "word_count": len((result.markdown or result.cleaned_html or '').split()),
-                    "links_count": len(getattr(result, 'links', [])),
-                    "media_count": len(getattr(result, 'media', []))
-                }
-            }, indent=2)
+        def in_scope(url: str) -> bool:
+            if same_domain and _site_host(url) != seed_host:
+                return False
+            if SKIPPED_EXTENSIONS.search(urlparse(url).path):
+                return False
+            if include and not any(pattern.search(url) for pattern in include):
+                return False
+            return not any(pattern.search(url) for pattern in exclude)
         
-        logger.info(f"Successfully crawled {url} with {output_format} format")
-        return [{"type": "text", "text": content}]
+        scheduler = HostScheduler(
+            per_host_limit=int(arguments.get("per_host_limit", BATCH_PER_HOST_LIMIT)),
+            per_host_delay=float(arguments.get("per_host_delay", BATCH_PER_HOST_DELAY)),
+        )
+        max_concurrency = max(1, int(arguments.get("max_concurrency", get_crawler_pool().size)))
+        
+        # Frontier ordered by depth, then discovery order: breadth-first
+        frontier = [(0, 0, seed)]
+        seen = {normalize_url(seed)}
+        discovered = 1
+        results: List[Dict[str, Any]] = []
+        skipped = {"robots": 0, "out_of_scope": 0}
+        
+        async def crawl_one(depth: int, url: str) -> Optional[Dict[str, Any]]:
+            """Crawl one page and queue its links; None if robots.txt forbids it"""
+            nonlocal discovered
+            item = {"url": url, "depth": depth}
+            try:
+                if respect_robots:
+                    robots = await fetch_robots(url)
+                    if not robots.can_fetch(USER_AGENT, url):
+                        skipped["robots"] += 1
+                        return None
+                    delay = robots.crawl_delay(USER_AGENT)
+                    if delay:
+                        scheduler.per_host_delay = max(scheduler.per_host_delay, float(delay))
+                page, timings = await scheduler.fetch(url, **retrying, **options)
+                if depth < max_depth:
+                    for link in page_links(page):
+                        key = normalize_url(link)
+                        if key in seen:
+                            continue
+                        seen.add(key)
+                        if not in_scope(link):
+                            skipped["out_of_scope"] += 1
+                            continue
+                        heapq.heappush(frontier, (depth + 1, discovered, link))
+                        discovered += 1
+                if writer:
+                    await writer.awrite(export_record(url, page, timings=timings, depth=depth))
+                    return dict(item, success=True, title=page["title"])
+                with timed("serialization"):
+                    content = await offload(format_result, url, page, output_format, 0, 0, *formatting,
+                                            size=page_size(page))
+                return dict(item, success=True, title=page["title"], content=content)
+            except CrawlError as e:
+                logger.error(str(e))
+                error_msg = str(e)
+            except Exception as e:
+                error_msg = f"Exception while crawling {url}: {str(e)}"
+                logger.error(error_msg)
+            if writer:
+                await writer.awrite(export_record(url, error=error_msg, depth=depth))
+            return dict(item, success=False, error=error_msg)
+        
+        await _report(progress, 0, max_pages)
+        running = set()
+        started = 0
+        while frontier or running:
+            while frontier and len(running) < max_concurrency and started < max_pages:
+                depth, _, url = heapq.heappop(frontier)
+                running.add(asyncio.ensure_future(crawl_one(depth, url)))
+                started += 1
+            if not running:
+                break
+            done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                item = task.result()
+                if item is None:
+                    # Pages skipped for robots.txt do not count against max_pages
+                    started -= 1
+                    continue
+                results.append(item)
+                await _report(progress, len(results), max_pages, f"Crawled {item['url']}")
+        
+        succeeded = sum(1 for item in results if item["success"])
+        summary = {
+            "seed": seed,
+            "crawled": len(results),
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+            "max_depth_reached": max((item["depth"] for item in results), default=0),
+            "frontier_remaining": len(frontier),
+            "skipped_robots": skipped["robots"],
+            "skipped_out_of_scope": skipped["out_of_scope"],
+        }
+        logger.info(f"Site crawl from {seed} fetched {succeeded}/{len(results)} pages")
+        if writer:
+            exported = await writer.aclose()
+            logger.info(f"Exported {exported['records']} records to {exported['path']}")
+            return [{"type": "text", "text": to_json({
+                "summary": summary,
+                "export": exported,
+                "errors": [item for item in results if not item["success"]]
+            })}]
+        with timed("serialization"):
+            size = sum(len(item.get("content", '')) for item in results)
+            return [{"type": "text", "text": await offload(to_json, {
+                "summary": summary,
+                "results": results
+            }, size=size)}]
         
     except Exception as e:
-        error_msg = f"Exception while crawling {url}: {str(e)}"
+        error_msg = f"Exception while crawling site: {str(e)}"
         logger.error(error_msg)
         return [{"type": "text", "text": error_msg}]
+    finally:
+        if writer:
+            writer.discard()
 
-async def get_metadata_handler(arguments: Dict[str, Any]):
-    """Handle get_metadata tool calls"""
+# Sitemap discovery limits
+DISCOVER_MAX_URLS = _env_int("CRAWL4AI_DISCOVER_MAX_URLS", 100000)
+DISCOVER_DEFAULT_URLS = 1000
+SITEMAP_MAX_FILES = 500
+SITEMAP_MAX_BYTES = 200 * 1024 * 1024
+SITEMAP_CHUNK_BYTES = 64 * 1024
+
+def parse_lastmod(value: Optional[str]):
+    """Parse a W3C datetime such as 2024-05-01 or 2024-05-01T10:00:00Z, assuming UTC"""
+    from datetime import datetime, timezone
+
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        parsed = datetime.fromisoformat(value[:-1] + "+00:00" if value.endswith("Z") else value)
+    except ValueError:
+        try:
+            parsed = datetime.strptime(value[:10], "%Y-%m-%d")
+        except ValueError:
+            return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+async def iter_sitemap(url: str):
+    """Stream (kind, loc, lastmod) entries of a sitemap, kind being "url" or "sitemap"
+
+    The body is fed to an incremental lxml parser chunk by chunk and every
+    entry is discarded once yielded, so memory stays flat however large the
+    sitemap is. Gzip-compressed sitemaps are inflated on the fly.
+    """
+    try:
+        import aiohttp
+        from lxml import etree
+    except ImportError as e:
+        logger.error(f"Failed to import sitemap dependencies: {e}")
+        raise RuntimeError("lxml is not installed. Please install it with: pip install lxml")
+    
+    parser = etree.XMLPullParser(events=("end",), tag=("{*}url", "{*}sitemap"), resolve_entities=False,
+                                 no_network=True, huge_tree=True)
+    session = await get_http_session()
+    # Large sitemaps take longer than HTTP_TIMEOUT in total, so only stalls time out
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=HTTP_TIMEOUT, sock_read=HTTP_TIMEOUT)
+    host = urlparse(url).netloc.lower()
+    async with host_limiter.slot(host), session.get(url, timeout=timeout) as response:
+        host_limiter.record(host, response.status, parse_retry_after(response.headers.get("Retry-After")))
+        if response.status != 200:
+            raise CrawlError(f"Failed to read sitemap {url}: HTTP {response.status}")
+        inflate = None
+        size = 0
+        async for chunk in response.content.iter_chunked(SITEMAP_CHUNK_BYTES):
+            if size == 0 and chunk[:2] == b"\x1f\x8b":
+                inflate = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            if inflate is not None:
+                chunk = inflate.decompress(chunk)
+            size += len(chunk)
+            if size > SITEMAP_MAX_BYTES:
+                raise CrawlError(f"Failed to read sitemap {url}: larger than {SITEMAP_MAX_BYTES} bytes")
+            parser.feed(chunk)
+            for _, element in parser.read_events():
+                kind = element.tag.rpartition("}")[2]
+                fields = {child.tag.rpartition("}")[2]: (child.text or '').strip() for child in element
+                          if isinstance(child.tag, str)}
+                # Drop the finished entry and its predecessors to keep the tree empty
+                element.clear()
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+                if fields.get("loc"):
+                    yield kind, fields["loc"], fields.get("lastmod") or None
+
+async def discover_urls_handler(arguments: Dict[str, Any], progress: Optional[ProgressCallback] = None):
+    """Handle discover_urls tool calls"""
     try:
         url = arguments.get("url")
-        if not url:
-            return [{"type": "text", "text": "Error: URL is required"}]
+        error = validate_url(url)
+        if error:
+            return [{"type": "text", "text": error}]
         
-        # Validate URL
-        parsed = urlparse(url)
-        if not parsed.scheme or not parsed.netloc:
-            return [{"type": "text", "text": f"Error: Invalid URL format: {url}"}]
+        since = None
+        if arguments.get("since"):
+            since = parse_lastmod(str(arguments["since"]))
+            if since is None:
+                return [{"type": "text", "text": f"Error: Invalid since date: {arguments['since']}"}]
         
-        # Get crawler instance
-        crawler_instance = await get_crawler()
+        max_urls = int(arguments.get("max_urls", DISCOVER_DEFAULT_URLS))
+        if not 1 <= max_urls <= DISCOVER_MAX_URLS:
+            return [{"type": "text", "text": f"Error: max_urls must be between 1 and {DISCOVER_MAX_URLS}"}]
         
-        # Suppress all Crawl4AI output during crawling
-        with StdoutRedirect():
-            result = await crawler_instance.arun(url=url)
+        try:
+            include = [re.compile(pattern) for pattern in arguments.get("include_patterns") or []]
+            exclude = [re.compile(pattern) for pattern in arguments.get("exclude_patterns") or []]
+        except re.error as e:
+            return [{"type": "text", "text": f"Error: Invalid pattern: {e}"}]
         
-        if not result.success:
-            error_msg = f"Failed to crawl {url}: {result.error_message if hasattr(result, 'error_message') else 'Unknown error'}"
-            logger.error(error_msg)
-            return [{"type": "text", "text": error_msg}]
+        parsed = urlparse(url)
+        if re.search(r"sitemap|\.xml(\.gz)?$", parsed.path, re.IGNORECASE):
+            sitemaps = [url]
+        else:
+            robots = await fetch_robots(url)
+            sitemaps = list(robots.site_maps() or []) or [f"{parsed.scheme}://{parsed.netloc}/sitemap.xml"]
         
-        # Extract metadata
-        metadata = {
-            "url": url,
-            "title": getattr(result, 'title', ''),
-            "word_count": len((result.markdown or result.cleaned_html or '').split()),
-            "links_count": len(getattr(result, 'links', [])),
-            "media_count": len(getattr(result, 'media', [])),
-            "status_code": getattr(result, 'status_code', 200),
-            "language": getattr(result, 'language', '')
+        queue = deque(sitemaps)
+        queued = set(sitemaps)
+        found: Dict[str, Optional[str]] = {}
+        counts = {"sitemaps_read": 0, "older_than_since": 0, "without_lastmod": 0, "filtered_out": 0}
+        errors = []
+        truncated = False
+        while queue and not truncated:
+            sitemap = queue.popleft()
+            try:
+                # Closed explicitly, so stopping early releases the response and host slot at once
+                entries = iter_sitemap(sitemap)
+                try:
+                    async for kind, loc, lastmod in entries:
+                        modified = parse_lastmod(lastmod)
+                        if since is not None and modified is not None and modified < since:
+                            counts["older_than_since"] += 1
+                            continue
+                        if kind == "sitemap":
+                            if loc not in queued and len(queued) < SITEMAP_MAX_FILES:
+                                queued.add(loc)
+                                queue.append(loc)
+                            continue
+                        if since is not None and modified is None:
+                            counts["without_lastmod"] += 1
+                            continue
+                        if (include and not any(pattern.search(loc) for pattern in include)) or \
+                                any(pattern.search(loc) for pattern in exclude):
+                            counts["filtered_out"] += 1
+                            continue
+                        found.setdefault(loc, lastmod)
+                        if len(found) >= max_urls:
+                            truncated = True
+                            break
+                finally:
+                    await entries.aclose()
+            except Exception as e:
+                errors.append(f"{sitemap}: {e}")
+                logger.error(f"Failed to read sitemap {sitemap}: {e}")
+            counts["sitemaps_read"] += 1
+            await _report(progress, counts["sitemaps_read"], counts["sitemaps_read"] + len(queue),
+                          f"Read {sitemap}, {len(found)} URLs so far")
+        
+        logger.info(f"Discovered {len(found)} URLs for {url} in {counts['sitemaps_read']} sitemaps")
+        payload = {
+            "summary": dict(counts, urls=len(found), truncated=truncated, sitemaps_pending=len(queue), errors=errors),
+            "urls": [{"url": loc, "lastmod": lastmod} for loc, lastmod in found.items()],
         }
         
-        logger.info(f"Successfully extracted metadata for {url}")
-        return [{"type": "text", "text": json.dumps(metadata, indent=2)}]
+        if arguments.get("crawl") and found:
+            # Newest pages first, since only BATCH_MAX_URLS of them fit in one batch
+            dated = {loc: parse_lastmod(lastmod) for loc, lastmod in found.items()}
+            newest = sorted(found, key=lambda loc: (dated[loc] is not None, dated[loc] and dated[loc].timestamp()),
+                            reverse=True)[:BATCH_MAX_URLS]
+            batch = (await crawl_batch_handler(dict(arguments, urls=newest), progress))[0]["text"]
+            if batch.startswith(ERROR_PREFIXES):
+                return [{"type": "text", "text": batch}]
+            payload["crawl"] = json.loads(batch)
+        
+        with timed("serialization"):
+            return [{"type": "text", "text": await offload(to_json, payload, size=len(found) * 100)}]
         
     except Exception as e:
-        error_msg = f"Exception while getting metadata for {url}: {str(e)}"
+        error_msg = f"Exception while discovering URLs for {url}: {str(e)}"
+        logger.error(error_msg)
+        return [{"type": "text", "text": error_msg}]
+
+CHANGES_FORMATS = ["markdown", "json"]
+HEADING = re.compile(r"#{1,6} ")
+
+def markdown_blocks(markdown: str) -> List[str]:
+    """Split markdown into blocks at blank lines, keeping fenced code blocks whole"""
+    blocks, current, fenced = [], [], False
+    for line in markdown.splitlines():
+        if line.lstrip().startswith(("```", "~~~")):
+            fenced = not fenced
+        if not line.strip() and not fenced:
+            if current:
+                blocks.append("\n".join(current))
+                current = []
+            continue
+        # A heading always starts a block of its own
+        if HEADING.match(line) and current and not fenced:
+            blocks.append("\n".join(current))
+            current = []
+        current.append(line)
+    if current:
+        blocks.append("\n".join(current))
+    return blocks
+
+def block_hash(block: str) -> str:
+    """Hash of a block that ignores changes in whitespace only"""
+    return hashlib.sha1(" ".join(block.split()).encode("utf-8")).hexdigest()[:16]
+
+def diff_blocks(old_blocks: List[str], new_blocks: List[str]) -> List[Dict[str, Any]]:
+    """Changed, added and removed runs of blocks, each with its enclosing section heading"""
+    import difflib
+
+    matcher = difflib.SequenceMatcher(None, [block_hash(block) for block in old_blocks],
+                                      [block_hash(block) for block in new_blocks], autojunk=False)
+    changes = []
+    for op, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+        if op == "equal":
+            continue
+        blocks, position = (new_blocks, new_start) if new_end > new_start else (old_blocks, old_start)
+        section = next((block.splitlines()[0] for block in reversed(blocks[:position + 1])
+                        if HEADING.match(block)), None)
+        changes.append({
+            "op": {"replace": "changed", "insert": "added", "delete": "removed"}[op],
+            "section": section,
+            "before": old_blocks[old_start:old_end],
+            "after": new_blocks[new_start:new_end],
+        })
+    return changes
+
+def compare_snapshot(old_blocks: Optional[List[str]], markdown: str):
+    """Split a page into blocks and diff it against the previous snapshot's blocks"""
+    blocks = markdown_blocks(markdown)
+    return blocks, (diff_blocks(old_blocks, blocks) if old_blocks is not None else None)
+
+def format_changes(report: Dict[str, Any]) -> str:
+    """Render a crawl_changes report as markdown"""
+    if report["status"] == "new":
+        return (f"[First snapshot of {report['url']}; later calls return only what changed.]\n\n"
+                + report["content"])
+    if report["status"] == "unchanged":
+        return f"Unchanged since {report['previous_snapshot_at']} ({report['blocks']} blocks)"
+    lines = [f"{len(report['changes'])} change(s) since {report['previous_snapshot_at']} "
+             f"({report['blocks']} blocks now)"]
+    for change in report["changes"]:
+        lines.append(f"\n--- {change['op']} in {change['section'] or 'page start'}")
+        lines.extend(f"- {line}" for block in change["before"] for line in block.splitlines())
+        lines.extend(f"+ {line}" for block in change["after"] for line in block.splitlines())
+    return "\n".join(lines)
+
+async def crawl_changes_handler(arguments: Dict[str, Any], progress: Optional[ProgressCallback] = None):
+    """Handle crawl_changes tool calls"""
+    try:
+        url = arguments.get("url")
+        error = validate_url(url)
+        if error:
+            return [{"type": "text", "text": error}]
+        
+        output_format = arguments.get("output_format", "markdown")
+        if output_format not in CHANGES_FORMATS:
+            return [{"type": "text", "text": f"Error: Invalid output format: {output_format}"}]
+        
+        # Changes only show up in fresh crawls, so the cache is refreshed unless asked otherwise
+        options, error = crawl_options(dict(arguments, cache_mode=arguments.get("cache_mode", "refresh")))
+        if error:
+            return [{"type": "text", "text": error}]
+        retrying, error = retry_options(arguments)
+        if error:
+            return [{"type": "text", "text": error}]
+        
+        store = get_snapshot_store()
+        key = store.key(url, {"render": options["render"]})
+        previous = None if arguments.get("reset") else await store.alookup(key)
+        
+        await _report(progress, 0, 2, f"Fetching {url}")
+        page, _ = await fetch_with_retries(url, **retrying, **options)
+        # An error page is not the page's content; comparing it would replace the snapshot
+        if page["status_code"] >= 400:
+            raise CrawlError(f"Failed to check {url} for changes: HTTP {page['status_code']}, snapshot kept")
+        await _report(progress, 1, 2, f"Comparing {url}")
+        markdown = page["markdown"] or page["cleaned_html"]
+        old_blocks = previous["page"]["blocks"] if previous else None
+        blocks, changes = await offload(compare_snapshot, old_blocks, markdown, size=len(markdown))
+        
+        report = {"url": url, "blocks": len(blocks)}
+        if previous is None:
+            report.update(status="new", content=markdown)
+        else:
+            report["previous_snapshot_at"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(previous["stored_at"]))
+            report.update(status="changed" if changes else "unchanged", changes=changes)
+        if changes or previous is None:
+            await store.aput(key, {"url": url, "blocks": blocks})
+        await _report(progress, 2, 2)
+        
+        logger.info(f"Compared {url} with its snapshot: {report['status']}")
+        with timed("serialization"):
+            text = to_json(report) if output_format == "json" else format_changes(report)
+        return [{"type": "text", "text": text}]
+        
+    except CrawlError as e:
+        logger.error(str(e))
+        return [{"type": "text", "text": str(e)}]
+    except Exception as e:
+        error_msg = f"Exception while checking {url} for changes: {str(e)}"
         logger.error(error_msg)
         return [{"type": "text", "text": error_msg}]
 
-async def main():
+STATS_FORMATS = ["json", "prometheus"]
+
+async def server_stats_handler(arguments: Dict[str, Any], progress: Optional[ProgressCallback] = None):
+    """Handle server_stats tool calls"""
+    output_format = arguments.get("format", "json")
+    if output_format not in STATS_FORMATS:
+        return [{"type": "text", "text": f"Error: Invalid stats format: {output_format}"}]
+    if output_format == "prometheus":
+        return [{"type": "text", "text": stats.prometheus()}]
+    
+    snapshot = stats.snapshot()
+    snapshot["startup"] = dict(startup_timings, budget_ms=STARTUP_BUDGET_MS)
+    snapshot["throttled_hosts"] = host_limiter.snapshot()
+    if crawler_pool is not None:
+        snapshot["crawler_pool"] = {
+            "size": crawler_pool.size,
+            "idle": crawler_pool.idle_count,
+            "recycled": crawler_pool.recycled,
+            "memory": {(f"{name}_mb" if name.endswith("_rss") else name):
+                       (round(value / 2 ** 20, 1) if name.endswith("_rss") and value is not None else value)
+                       for name, value in crawler_pool.memory.items()},
+        }
+    return [{"type": "text", "text": json.dumps(snapshot, indent=2)}]
+
+TOOL_HANDLERS = {
+    "crawl_url": crawl_url_handler,
+    "crawl_batch": crawl_batch_handler,
+    "crawl_site": crawl_site_handler,
+    "discover_urls": discover_urls_handler,
+    "crawl_changes": crawl_changes_handler,
+    "get_metadata": get_metadata_handler,
+    "server_stats": server_stats_handler,
+}
+
+# Tool responses starting with these are counted as errors
+ERROR_PREFIXES = ("Error:", "Failed to crawl", "Exception while")
+
+async def dispatch_tool(name: str, arguments: Dict[str, Any],
+                        progress: Optional[ProgressCallback] = None) -> str:
+    """Run a tool handler, recording a timing span for the call"""
+    handler = TOOL_HANDLERS.get(name)
+    if handler is None:
+        return f"Unknown tool: {name}"
+    
+    trace: Dict[str, float] = {}
+    token = _current_trace.set(trace)
+    started = time.perf_counter()
+    try:
+        result = await handler(arguments, progress)
+    finally:
+        _current_trace.reset(token)
+    text = result[0]["text"]
+    trace["total"] = time.perf_counter() - started
+    
+    if name != "server_stats":
+        stats.record_call(name, trace, len(text), text.startswith(ERROR_PREFIXES))
+        span = {phase: round(seconds, 4) for phase, seconds in trace.items()}
+        logger.info("span " + json.dumps({"tool": name, "url": arguments.get("url"), "response_chars": len(text), **span}))
+    return text
+
+# Process roles: standalone serves MCP and crawls in-process; proxy serves MCP
+# and forwards tool calls to a shared daemon that owns the browsers and cache
+SERVER_MODES = ["standalone", "proxy", "daemon"]
+SERVER_MODE = os.environ.get("CRAWL4AI_MODE", "standalone")
+if SERVER_MODE not in SERVER_MODES:
+    logger.warning(f"Ignoring unknown CRAWL4AI_MODE {SERVER_MODE!r}; running standalone")
+    SERVER_MODE = "standalone"
+DAEMON_SOCKET = os.environ.get("CRAWL4AI_DAEMON_SOCKET") or os.path.join(CACHE_DIR, "daemon.sock")
+DAEMON_IDLE_TIMEOUT = _env_int("CRAWL4AI_DAEMON_IDLE_TIMEOUT", 1800)
+DAEMON_START_TIMEOUT = 30
+
+# Daemon messages are single JSON lines that may carry whole pages
+DAEMON_LINE_LIMIT = 256 * 1024 * 1024
+
+class CrawlerDaemon:
+    """Serve tool calls from many proxy sessions over a Unix socket
+
+    Each line a client sends is {"id", "tool", "arguments"}; the daemon answers
+    with {"id", "progress": [done, total, message]} updates and a final
+    {"id", "text"}. Calls on one connection run concurrently.
+    """
+
+    def __init__(self, socket_path: str = DAEMON_SOCKET, idle_timeout: int = DAEMON_IDLE_TIMEOUT):
+        self.socket_path = socket_path
+        self.idle_timeout = idle_timeout
+        self.connections = 0
+        self._idle_since = time.monotonic()
+
+    async def serve(self):
+        """Listen until idle for idle_timeout seconds (0 runs forever)"""
+        lock = self._acquire_lock()
+        if lock is None:
+            logger.info(f"Another crawler daemon already owns {self.socket_path}")
+            return
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        server = await asyncio.start_unix_server(self._handle, path=self.socket_path, limit=DAEMON_LINE_LIMIT)
+        os.chmod(self.socket_path, 0o600)
+        logger.info(f"Crawler daemon listening on {self.socket_path}")
+        if EAGER_START:
+            asyncio.ensure_future(warm_up())
+        stopping = asyncio.Event()
+        loop = asyncio.get_event_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, stopping.set)
+        try:
+            async with server:
+                while not self._idle_expired() and not stopping.is_set():
+                    try:
+                        await asyncio.wait_for(stopping.wait(), min(30, self.idle_timeout) if self.idle_timeout > 0 else 3600)
+                    except asyncio.TimeoutError:
+                        pass
+            logger.info("Crawler daemon shutting down")
+        finally:
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            lock.close()
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                loop.remove_signal_handler(signum)
+            await cleanup()
+
+    def _idle_expired(self) -> bool:
+        return (self.idle_timeout > 0 and self.connections == 0
+                and time.monotonic() - self._idle_since > self.idle_timeout)
+
+    def _acquire_lock(self):
+        """Hold an exclusive lock next to the socket so only one daemon binds it"""
+        import fcntl
+
+        os.makedirs(os.path.dirname(self.socket_path) or ".", exist_ok=True)
+        lock = open(f"{self.socket_path}.lock", "w")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            return None
+        return lock
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        write_lock = asyncio.Lock()
+        calls = set()
+
+        async def send(message: Dict[str, Any]):
+            async with write_lock:
+                writer.write(json.dumps(message).encode("utf-8") + b"\n")
+                await writer.drain()
+
+        async def run(request: Dict[str, Any]):
+            request_id = request.get("id")
+
+            async def progress(done: float, total: Optional[float] = None, message: Optional[str] = None):
+                await send({"id": request_id, "progress": [done, total, message]})
+
+            try:
+                text = await dispatch_tool(request.get("tool", ""), request.get("arguments") or {}, progress)
+            except Exception as e:
+                text = f"Exception while running {request.get('tool')}: {e}"
+                logger.error(text)
+            try:
+                await send({"id": request_id, "text": text})
+            except ConnectionError:
+                pass
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    logger.warning("Ignoring malformed daemon request")
+                    continue
+                task = asyncio.ensure_future(run(request))
+                calls.add(task)
+                task.add_done_callback(calls.discard)
+        except ConnectionError:
+            pass
+        finally:
+            for task in calls:
+                task.cancel()
+            writer.close()
+            self.connections -= 1
+            self._idle_since = time.monotonic()
+
+class DaemonClient:
+    """Forward tool calls to the crawler daemon, starting it when absent"""
+
+    def __init__(self, socket_path: str = DAEMON_SOCKET):
+        self.socket_path = socket_path
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Future] = None
+        self._pending: Dict[int, tuple] = {}
+        self._next_id = 0
+        self._connect_lock = asyncio.Lock()
+
+    async def _connect(self):
+        async with self._connect_lock:
+            if self._writer is not None and not self._writer.is_closing():
+                return
+            try:
+                reader, self._writer = await asyncio.open_unix_connection(self.socket_path, limit=DAEMON_LINE_LIMIT)
+            except (FileNotFoundError, ConnectionRefusedError):
+                self._spawn_daemon()
+                reader, self._writer = await self._wait_for_daemon()
+            self._reader_task = asyncio.ensure_future(self._read(reader))
+            logger.info(f"Connected to crawler daemon at {self.socket_path}")
+
+    def _spawn_daemon(self):
+        logger.info(f"Starting crawler daemon for {self.socket_path}")
+        env = dict(os.environ, CRAWL4AI_DAEMON_SOCKET=self.socket_path)
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--mode", "daemon"],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            env=env, start_new_session=True,
+        )
+
+    async def _wait_for_daemon(self):
+        deadline = time.monotonic() + DAEMON_START_TIMEOUT
+        while True:
+            try:
+                return await asyncio.open_unix_connection(self.socket_path, limit=DAEMON_LINE_LIMIT)
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"Crawler daemon did not start within {DAEMON_START_TIMEOUT}s")
+                await asyncio.sleep(0.1)
+
+    async def _read(self, reader: asyncio.StreamReader):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                future, progress = self._pending.get(message.get("id"), (None, None))
+                if future is None:
+                    continue
+                if "progress" in message:
+                    await _report(progress, *message["progress"])
+                elif not future.done():
+                    future.set_result(message.get("text", ""))
+        except (ConnectionError, ValueError) as e:
+            logger.error(f"Lost connection to crawler daemon: {e}")
+        finally:
+            self._writer = None
+            for future, _ in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("crawler daemon connection closed"))
+
+    async def call(self, name: str, arguments: Dict[str, Any],
+                   progress: Optional[ProgressCallback] = None) -> str:
+        """Run a tool on the daemon and return its text response"""
+        await self._connect()
+        self._next_id += 1
+        request_id = self._next_id
+        future = asyncio.get_event_loop().create_future()
+        self._pending[request_id] = (future, progress)
+        try:
+            self._writer.write(json.dumps({"id": request_id, "tool": name, "arguments": arguments}).encode("utf-8") + b"\n")
+            await self._writer.drain()
+            return await future
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+
+async def main(mode: str = SERVER_MODE):
     """Main function"""
     # Import MCP when needed
     try:
@@ -201,7 +3405,7 @@ async def main():
         logger.error(f"Failed to import MCP: {e}")
         raise RuntimeError("MCP is not installed. Please install it with: pip install mcp")
     
-    logger.info("Starting CS Crawler MCP")
+    logger.info(f"Starting CS Crawler MCP ({mode} mode)")
     
     # Create MCP server
     server = Server("cs-crawler-mcp")
@@ -224,12 +3428,217 @@ async def main():
                             "output_format": {
                                 "type": "string",
                                 "enum": ["markdown", "html", "text", "json"],
-                                "description": "Output format (default: markdown)"
+                                "description": "markdown, html (cleaned HTML), text (plain text) or json (content plus metadata) (default: markdown)"
+                            },
+                            "max_chars": {
+                                "type": "integer",
+                                "minimum": 0,
+                                "description": "Return at most this many characters, split at a heading or paragraph where possible; 0 returns the whole page"
+                            },
+                            "offset": {
+                                "type": "integer",
+                                "minimum": 0,
+                                "description": "Character offset to start from, as returned by the previous chunk (default: 0)"
+                            },
+                            "content": CONTENT_SCHEMA,
+                            "max_tokens": MAX_TOKENS_SCHEMA,
+                            "render": RENDER_SCHEMA,
+                            "network_profile": NETWORK_PROFILE_SCHEMA,
+                            "wait_for": WAIT_FOR_SCHEMA,
+                            "timeout_ms": TIMEOUT_MS_SCHEMA,
+                            "retries": RETRIES_SCHEMA,
+                            "retry_backoff": RETRY_BACKOFF_SCHEMA,
+                            "cache_mode": CACHE_MODE_SCHEMA
+                        },
+                        "required": ["url"]
+                    }
+                ),
+                Tool(
+                    name="crawl_batch",
+                    description="Crawl many URLs in one call with bounded concurrency and per-host politeness",
+                    inputSchema={
+                        "type": "object",
+                        "properties": {
+                            "urls": {
+                                "type": "array",
+                                "items": {"type": "string"},
+                                "description": f"The URLs to crawl (at most {BATCH_MAX_URLS})"
+                            },
+                            "output_format": {
+                                "type": "string",
+                                "enum": OUTPUT_FORMATS,
+                                "description": "Output format for each page (default: markdown)"
+                            },
+                            "max_concurrency": {
+                                "type": "integer",
+                                "minimum": 1,
+                                "description": "Maximum crawls in flight across all hosts (default: crawler pool size)"
+                            },
+                            "per_host_limit": {
+                                "type": "integer",
+                                "minimum": 1,
+                                "description": f"Maximum crawls in flight per host (default: {BATCH_PER_HOST_LIMIT})"
+                            },
+                            "per_host_delay": {
+                                "type": "number",
+                                "minimum": 0,
+                                "description": f"Minimum seconds between request starts on the same host (default: {BATCH_PER_HOST_DELAY})"
+                            },
+                            "content": CONTENT_SCHEMA,
+                            "max_tokens": MAX_TOKENS_SCHEMA,
+                            "render": RENDER_SCHEMA,
+                            "network_profile": NETWORK_PROFILE_SCHEMA,
+                            "wait_for": WAIT_FOR_SCHEMA,
+                            "timeout_ms": TIMEOUT_MS_SCHEMA,
+                            "retries": RETRIES_SCHEMA,
+                            "retry_backoff": RETRY_BACKOFF_SCHEMA,
+                            "cache_mode": CACHE_MODE_SCHEMA,
+                            "export": EXPORT_SCHEMA
+                        },
+                        "required": ["urls"]
+                    }
+                ),
+                Tool(
+                    name="crawl_site",
+                    description="Crawl a site breadth-first from a seed URL, following links up to depth and page limits",
+                    inputSchema={
+                        "type": "object",
+                        "properties": {
+                            "url": {
+                                "type": "string",
+                                "description": "The seed URL to start from"
+                            },
+                            "max_depth": {
+                                "type": "integer",
+                                "minimum": 0,
+                                "description": f"Link hops to follow from the seed (default: {SITE_DEFAULT_DEPTH})"
+                            },
+                            "max_pages": {
+                                "type": "integer",
+                                "minimum": 1,
+                                "maximum": SITE_MAX_PAGES,
+                                "description": f"Pages to crawl at most (default: {SITE_DEFAULT_PAGES})"
+                            },
+                            "same_domain": {
+                                "type": "boolean",
+                                "description": "Only follow links on the seed's host, ignoring www. (default: true)"
+                            },
+                            "include_patterns": {
+                                "type": "array",
+                                "items": {"type": "string"},
+                                "description": "Regular expressions; when given, only matching URLs are followed"
+                            },
+                            "exclude_patterns": {
+                                "type": "array",
+                                "items": {"type": "string"},
+                                "description": "Regular expressions for URLs never to follow"
+                            },
+                            "respect_robots": {
+                                "type": "boolean",
+                                "description": "Skip pages robots.txt disallows and honour its Crawl-delay (default: true)"
+                            },
+                            "output_format": {
+                                "type": "string",
+                                "enum": OUTPUT_FORMATS,
+                                "description": "Output format for each page (default: markdown)"
+                            },
+                            "max_concurrency": {
+                                "type": "integer",
+                                "minimum": 1,
+                                "description": "Maximum crawls in flight (default: crawler pool size)"
+                            },
+                            "per_host_limit": {
+                                "type": "integer",
+                                "minimum": 1,
+                                "description": f"Maximum crawls in flight per host (default: {BATCH_PER_HOST_LIMIT})"
+                            },
+                            "per_host_delay": {
+                                "type": "number",
+                                "minimum": 0,
+                                "description": f"Minimum seconds between request starts on the same host (default: {BATCH_PER_HOST_DELAY})"
+                            },
+                            "content": CONTENT_SCHEMA,
+                            "max_tokens": MAX_TOKENS_SCHEMA,
+                            "render": RENDER_SCHEMA,
+                            "network_profile": NETWORK_PROFILE_SCHEMA,
+                            "wait_for": WAIT_FOR_SCHEMA,
+                            "timeout_ms": TIMEOUT_MS_SCHEMA,
+                            "retries": RETRIES_SCHEMA,
+                            "retry_backoff": RETRY_BACKOFF_SCHEMA,
+                            "cache_mode": CACHE_MODE_SCHEMA,
+                            "export": EXPORT_SCHEMA
+                        },
+                        "required": ["url"]
+                    }
+                ),
+                Tool(
+                    name="discover_urls",
+                    description="List a site's URLs from robots.txt and its (nested, gzipped) XML sitemaps, optionally crawling the newest",
+                    inputSchema={
+                        "type": "object",
+                        "properties": {
+                            "url": {
+                                "type": "string",
+                                "description": "A sitemap URL, or any URL of the site to find its sitemaps through robots.txt"
+                            },
+                            "since": {
+                                "type": "string",
+                                "description": "Only URLs whose lastmod is on or after this date (YYYY-MM-DD or ISO 8601)"
+                            },
+                            "max_urls": {
+                                "type": "integer",
+                                "minimum": 1,
+                                "maximum": DISCOVER_MAX_URLS,
+                                "description": f"Stop after this many URLs (default: {DISCOVER_DEFAULT_URLS})"
+                            },
+                            "include_patterns": {
+                                "type": "array",
+                                "items": {"type": "string"},
+                                "description": "Regular expressions; when given, only matching URLs are returned"
+                            },
+                            "exclude_patterns": {
+                                "type": "array",
+                                "items": {"type": "string"},
+                                "description": "Regular expressions for URLs to leave out"
+                            },
+                            "crawl": {
+                                "type": "boolean",
+                                "description": f"Also crawl the newest {BATCH_MAX_URLS} URLs found, as crawl_batch would; crawl_batch arguments such as output_format and render apply (default: false)"
                             }
                         },
                         "required": ["url"]
                     }
                 ),
+                Tool(
+                    name="crawl_changes",
+                    description="Crawl a URL and return only the sections that changed since the previous crawl_changes call for it",
+                    inputSchema={
+                        "type": "object",
+                        "properties": {
+                            "url": {
+                                "type": "string",
+                                "description": "The URL to check"
+                            },
+                            "output_format": {
+                                "type": "string",
+                                "enum": CHANGES_FORMATS,
+                                "description": "markdown: a readable diff; json: the changes with their section headings (default: markdown)"
+                            },
+                            "reset": {
+                                "type": "boolean",
+                                "description": "Ignore the stored snapshot and start a new baseline (default: false)"
+                            },
+                            "render": RENDER_SCHEMA,
+                            "network_profile": NETWORK_PROFILE_SCHEMA,
+                            "wait_for": WAIT_FOR_SCHEMA,
+                            "timeout_ms": TIMEOUT_MS_SCHEMA,
+                            "retries": RETRIES_SCHEMA,
+                            "retry_backoff": RETRY_BACKOFF_SCHEMA,
+                            "cache_mode": dict(CACHE_MODE_SCHEMA, description="Cache mode for the crawl (default: refresh, so every call sees the live page)")
+                        },
+                        "required": ["url"]
+                    }
+                ),
                 Tool(
                     name="get_metadata",
                     description="Get metadata about a URL without downloading the full content",
@@ -239,28 +3648,74 @@ async def main():
                             "url": {
                                 "type": "string",
                                 "description": "The URL to get metadata for"
-                            }
+                            },
+                            "mode": {
+                                "type": "string",
+                                "enum": METADATA_MODES,
+                                "description": "auto: read headers and <head> over plain HTTP, using the browser only for pages that need JavaScript; fast: never use the browser; browser: full render, adds word/link/media counts (default: auto)"
+                            },
+                            "network_profile": NETWORK_PROFILE_SCHEMA,
+                            "cache_mode": CACHE_MODE_SCHEMA
                         },
                         "required": ["url"]
                     }
+                ),
+                Tool(
+                    name="server_stats",
+                    description="Report call counts, per-phase latency histograms (queue wait, crawler acquisition, navigation, extraction, serialization) and response sizes",
+                    inputSchema={
+                        "type": "object",
+                        "properties": {
+                            "format": {
+                                "type": "string",
+                                "enum": STATS_FORMATS,
+                                "description": "json summary or Prometheus text exposition format (default: json)"
+                            }
+                        }
+                    }
                 )
             ]
         )
     
+    def progress_reporter() -> Optional[ProgressCallback]:
+        """Build a progress callback for the current request, if it has a token"""
+        context = server.request_context
+        token = getattr(context.meta, "progressToken", None) if context.meta else None
+        if token is None:
+            return None
+        
+        async def report(done: float, total: Optional[float] = None, message: Optional[str] = None):
+            try:
+                await context.session.send_progress_notification(token, done, total, message=message)
+            except TypeError:
+                # Older MCP releases have no message field
+                await context.session.send_progress_notification(token, done, total)
+        return report
+    
+    daemon = DaemonClient() if mode == "proxy" else None
+
     @server.call_tool()
     async def call_tool(name: str, arguments: Dict[str, Any]) -> List[TextContent]:
-        if name == "crawl_url":
-            result = await crawl_url_handler(arguments)
-            return [TextContent(type="text", text=result[0]["text"])]
-        elif name == "get_metadata":
-            result = await get_metadata_handler(arguments)
-            return [TextContent(type="text", text=result[0]["text"])]
+        if daemon is not None:
+            try:
+                text = await daemon.call(name, arguments, progress_reporter())
+            except Exception as e:
+                text = f"Exception while forwarding {name} to the crawler daemon: {e}"
+                logger.error(text)
         else:
-            return [TextContent(type="text", text=f"Unknown tool: {name}")]
+            text = await dispatch_tool(name, arguments, progress_reporter())
+        return [TextContent(type="text", text=text)]
     
     try:
         options = server.create_initialization_options()
         async with stdio_server() as (read_stream, write_stream):
+            divert_stray_stdout()
+            if EAGER_START and daemon is None:
+                # Tool calls wait on this warm-up instead of starting their own browser
+                asyncio.ensure_future(warm_up())
+            _mark_startup("mcp_ready_ms")
+            if startup_timings["mcp_ready_ms"] > STARTUP_BUDGET_MS:
+                logger.warning(f"Startup took {startup_timings['mcp_ready_ms']}ms, over the {STARTUP_BUDGET_MS}ms budget")
             logger.info("MCP server started successfully")
             await server.run(read_stream, write_stream, options, raise_exceptions=True)
     except KeyboardInterrupt:
@@ -269,12 +3724,22 @@ async def main():
         logger.error(f"Server error: {e}")
         raise
     finally:
+        if daemon is not None:
+            await daemon.close()
         await cleanup()
         logger.info("Server cleanup completed")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="CS Crawler MCP")
+    parser.add_argument("--mode", choices=SERVER_MODES, default=SERVER_MODE,
+                        help="standalone: crawl in this process; proxy: forward tool calls to the shared "
+                             "crawler daemon, starting it if needed; daemon: run the shared crawler daemon")
+    args = parser.parse_args()
     try:
-        asyncio.run(main())
+        if args.mode == "daemon":
+            asyncio.run(CrawlerDaemon().serve())
+        else:
+            asyncio.run(main(args.mode))
     except KeyboardInterrupt:
         logger.info("Server interrupted by user")
     except Exception as e:
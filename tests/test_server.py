@@ -0,0 +1,970 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the server internals that do not need a live browser
+"""
+
+import asyncio
+import io
+import json
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server  # noqa: E402
+
+
+class FakeCrawler:
+    """Stand-in for AsyncWebCrawler that records its lifecycle"""
+
+    def __init__(self):
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def fake_crawlers(monkeypatch):
+    """Make the pool launch FakeCrawler instances instead of browsers"""
+    created = []
+
+    async def create(config=None):
+        created.append(FakeCrawler())
+        return created[-1]
+
+    monkeypatch.setattr(server, "_create_crawler", create)
+    return created
+
+
+async def test_pool_recycles_after_max_uses(fake_crawlers):
+    """A crawler is replaced once it has served max_uses navigations"""
+    pool = server.CrawlerPool(size=1, max_uses=2)
+    for _ in range(3):
+        async with pool.lease():
+            pass
+    assert len(fake_crawlers) == 2
+    assert fake_crawlers[0].closed
+    assert pool.recycled == 1
+
+
+async def test_pool_recycles_crashed_crawler(fake_crawlers):
+    """An exception during a lease discards the crawler"""
+    pool = server.CrawlerPool(size=1, max_uses=10)
+    with pytest.raises(RuntimeError):
+        async with pool.lease():
+            raise RuntimeError("browser crashed")
+    async with pool.lease() as crawler_instance:
+        assert crawler_instance is fake_crawlers[1]
+    assert fake_crawlers[0].closed
+
+
+async def test_quiet_output_is_task_local(monkeypatch):
+    """Suppression in one task neither leaks into nor is undone by another"""
+    visible = io.StringIO()
+    monkeypatch.setattr(sys, "stdout", server._GuardedStream(visible))
+    release = asyncio.Event()
+
+    async def quiet_task():
+        with server.quiet_output():
+            print("hidden before")
+            await release.wait()
+            print("hidden after")
+
+    async def loud_task():
+        print("shown")
+        release.set()
+
+    await asyncio.gather(quiet_task(), loud_task())
+    print("shown again")
+    assert visible.getvalue() == "shown\nshown again\n"
+
+
+def make_page(url, markdown="# Page"):
+    """Page dict as produced by server.html_to_page"""
+    page = {
+        "url": url,
+        "title": "Page",
+        "markdown": markdown,
+        "cleaned_html": f"<h1>{markdown}</h1>",
+        "links": {},
+        "media": {},
+        "status_code": 200,
+        "language": "en",
+    }
+    page.update(server.analyze_html(url, page["cleaned_html"]))
+    del page["text"]
+    return page
+
+
+async def test_crawl_batch_limits_per_host_concurrency(monkeypatch):
+    """crawl_batch never runs more than per_host_limit crawls on one host"""
+    in_flight = {}
+    peak = {}
+
+    async def fake_load(url, render="auto", **options):
+        host = server.urlparse(url).netloc
+        in_flight[host] = in_flight.get(host, 0) + 1
+        peak[host] = max(peak.get(host, 0), in_flight[host])
+        await asyncio.sleep(0.01)
+        in_flight[host] -= 1
+        return make_page(url)
+
+    monkeypatch.setattr(server, "load_page", fake_load)
+    monkeypatch.setattr(server, "get_response_cache", lambda: None)
+    monkeypatch.setattr(server, "recent_pages", server.RecentPages(window=0))
+    urls = [f"https://a.example/{i}" for i in range(6)] + ["https://b.example/", "nope"]
+    result = await server.crawl_batch_handler(
+        {"urls": urls, "max_concurrency": 8, "per_host_limit": 2, "per_host_delay": 0}
+    )
+    payload = json.loads(result[0]["text"])
+    assert payload["summary"] == {"total": 8, "succeeded": 7, "failed": 1}
+    assert [item["url"] for item in payload["results"]] == urls
+    assert peak["a.example"] == 2
+
+
+async def test_crawl_batch_serves_cached_pages_without_host_delay(tmp_path, monkeypatch):
+    """Only real loads are spaced out per host; cached pages come back at once"""
+    loads = []
+
+    async def fake_load(url, render="auto", **options):
+        loads.append(url)
+        return make_page(url)
+
+    monkeypatch.setattr(server, "load_page", fake_load)
+    cache = server.ResponseCache(directory=str(tmp_path))
+    monkeypatch.setattr(server, "get_response_cache", lambda: cache)
+    monkeypatch.setattr(server, "recent_pages", server.RecentPages(window=0))
+    urls = [f"https://a.example/{i}" for i in range(20)]
+    await server.crawl_batch_handler({"urls": urls, "per_host_delay": 0})
+    started = time.monotonic()
+    result = await server.crawl_batch_handler({"urls": urls, "per_host_delay": 1, "max_concurrency": 1})
+    assert json.loads(result[0]["text"])["summary"]["succeeded"] == 20
+    assert len(loads) == 20 and time.monotonic() - started < 0.5
+
+
+def test_normalize_url():
+    """Equivalent URLs share one cache key"""
+    assert server.normalize_url("HTTPS://Example.com:443?b=2&a=1#top") == "https://example.com/?a=1&b=2"
+    assert server.normalize_url("http://example.com:8080/x") == "http://example.com:8080/x"
+
+
+def test_response_cache_ttl_and_lru(tmp_path, monkeypatch):
+    """Entries expire after the TTL and the least recently used one is evicted"""
+    cache = server.ResponseCache(directory=str(tmp_path), ttl=60, max_bytes=10_000)
+    pages = {name: {"url": name, "markdown": "x" * 3000} for name in "abcd"}
+    keys = {name: cache.key(f"https://example.com/{name}") for name in pages}
+    for name in "abc":
+        cache.put(keys[name], pages[name])
+    assert cache.get(keys["a"]) == pages["a"]
+
+    cache.put(keys["d"], pages["d"])
+    assert cache.get(keys["b"]) is None
+    assert cache.get(keys["a"]) == pages["a"]
+
+    now = server.time.time()
+    monkeypatch.setattr(server.time, "time", lambda: now + 61)
+    assert cache.get(keys["a"]) is None
+
+
+@pytest.fixture
+async def serve():
+    """Start local HTTP servers: await serve(handler) routes every path to handler and returns the base URL"""
+    from aiohttp import web
+
+    runners = []
+
+    async def start(handler, method="GET"):
+        app = web.Application()
+        app.router.add_route(method, "/{tail:.*}", handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", 0).start()
+        runners.append(runner)
+        return f"http://127.0.0.1:{runner.addresses[0][1]}"
+
+    yield start
+    await server.cleanup()
+    for runner in runners:
+        await runner.cleanup()
+
+
+@pytest.fixture
+async def site(serve):
+    """Serve a few fixed pages on a local port"""
+    from aiohttp import web
+
+    body = "<p>" + "filler " * 50000 + "</p>"
+    pages = {
+        "/doc": "<html lang='nl'><head><title> Docs\n page </title>"
+        "<meta name='description' content='All the docs'>"
+        "<meta property='og:type' content='article'>"
+        "<link rel='canonical' href='https://example.com/doc'></head>"
+        f"<body>{body}</body></html>",
+        "/spa": "<html><head><script src='/app.js'></script></head>"
+        "<body><div id='root'></div></body></html>",
+    }
+    served = []
+
+    async def handle(request):
+        served.append(request.method)
+        return web.Response(text=pages[request.path], content_type="text/html")
+
+    yield await serve(handle, method="*"), served
+
+
+async def test_fetch_head_metadata_reads_only_the_head(site):
+    """The fast path parses <head> fields and flags pages without a title"""
+    base, served = site
+    metadata = await server.fetch_head_metadata(f"{base}/doc")
+    assert metadata["title"] == "Docs page"
+    assert metadata["language"] == "nl"
+    assert metadata["description"] == "All the docs"
+    assert metadata["canonical"] == "https://example.com/doc"
+    assert metadata["meta"]["og:type"] == "article"
+    assert metadata["needs_javascript"] is False
+    assert served == ["HEAD", "GET"]
+
+    metadata = await server.fetch_head_metadata(f"{base}/spa")
+    assert metadata["needs_javascript"] is True
+
+
+async def test_auto_render_escalates_only_when_needed(site, monkeypatch):
+    """Static pages skip the browser; SPA shells are re-rendered in it"""
+    base, _ = site
+    rendered = []
+
+    async def fake_render(url, **options):
+        rendered.append(url)
+        return make_page(url, markdown="rendered")
+
+    monkeypatch.setattr(server, "render_page", fake_render)
+    page = await server.load_page(f"{base}/doc", render="auto")
+    assert page["title"] == "Docs page"
+    assert page["language"] == "nl"
+    assert "filler" in page["markdown"]
+    assert rendered == []
+
+    page = await server.load_page(f"{base}/spa", render="auto")
+    assert page["markdown"] == "rendered"
+    assert rendered == [f"{base}/spa"]
+
+    page = await server.load_page(f"{base}/spa", render="static")
+    assert page["markdown"].strip() == ""
+
+
+def test_paginate_splits_on_headings():
+    """Chunks end before a heading and cover the whole document in order"""
+    doc = "# A\n\n" + "one. " * 60 + "\n\n## B\n\n" + "two. " * 60 + "\n\n## C\n\nend"
+    chunks, offset = [], 0
+    while offset is not None:
+        chunk, offset = server.paginate(doc, offset, 400)
+        chunks.append(chunk)
+    assert "".join(chunks) == doc
+    assert chunks[1].startswith("## B")
+    assert all(len(chunk) <= 400 for chunk in chunks)
+
+    page = make_page("https://example.com/", markdown=doc)
+    data = json.loads(server.format_result(page["url"], page, "json", offset=0, max_chars=400))
+    assert data["pagination"]["next_offset"] == len(chunks[0])
+    assert data["content"] == chunks[0]
+
+
+async def test_offset_past_the_end_is_an_error(monkeypatch, caplog):
+    """crawl_url reports an offset beyond the content as an error, not a successful crawl"""
+    async def fake_fetch(url, **options):
+        return make_page(url)
+
+    monkeypatch.setattr(server, "fetch_page", fake_fetch)
+    with caplog.at_level("INFO", logger=server.logger.name):
+        result = await server.crawl_url_handler({"url": "https://example.com/", "offset": 5000})
+    assert result[0]["text"].startswith("Error: offset 5000 is past the end")
+    assert "Successfully crawled" not in caplog.text
+
+
+async def test_concurrent_identical_crawls_share_one_fetch(monkeypatch):
+    """Callers asking for the same page at once trigger a single load"""
+    loads = []
+
+    async def fake_load(url, render="auto", **options):
+        loads.append(url)
+        await asyncio.sleep(0.01)
+        return make_page(url)
+
+    monkeypatch.setattr(server, "load_page", fake_load)
+    monkeypatch.setattr(server, "recent_pages", server.RecentPages(window=30))
+    monkeypatch.setattr(server, "get_response_cache", lambda: None)
+
+    pages = await asyncio.gather(
+        server.fetch_page("https://example.com/a?x=1", render="auto"),
+        server.fetch_page("https://EXAMPLE.com/a?x=1#frag", render="auto"),
+    )
+    assert loads == ["https://example.com/a?x=1"]
+    assert pages[0] is pages[1]
+
+    result = await server.get_metadata_handler({"url": "https://example.com/a?x=1"})
+    assert json.loads(result[0]["text"])["source"] == "recent"
+    assert len(loads) == 1
+
+    # Other crawl options mean another page; metadata takes the page crawled with any of them
+    await server.fetch_page("https://example.com/a?x=1", render="auto", wait_for="load")
+    await server.fetch_page("https://example.com/a?x=1", render="auto", wait_for="load")
+    assert len(loads) == 2
+    assert server.recent_pages.get("https://example.com/a?x=1", options={"wait_for": "networkidle"}) is None
+
+    # A refresh does not join a flight started with the cache allowed
+    await asyncio.gather(
+        server.fetch_page("https://example.com/r", render="auto"),
+        server.fetch_page("https://example.com/r", render="auto", cache_mode="refresh"),
+    )
+    assert loads.count("https://example.com/r") == 2
+
+
+async def test_dispatch_records_phase_timings(monkeypatch):
+    """Every tool call lands in the stats with its phases and response size"""
+    async def fake_load(url, render="auto", **options):
+        with server.timed("navigation"):
+            await asyncio.sleep(0.01)
+        return make_page(url, markdown="# Page\n\n" + "text " * 50)
+
+    monkeypatch.setattr(server, "stats", server.ServerStats())
+    monkeypatch.setattr(server, "load_page", fake_load)
+    monkeypatch.setattr(server, "get_response_cache", lambda: None)
+
+    text = await server.dispatch_tool("crawl_url", {"url": "https://example.com/stats", "cache_mode": "bypass"})
+    await server.dispatch_tool("crawl_url", {"url": "not a url"})
+
+    snapshot = json.loads(await server.dispatch_tool("server_stats", {}))
+    crawl = snapshot["tools"]["crawl_url"]
+    assert crawl["calls"] == 2 and crawl["errors"] == 1
+    assert crawl["phases_seconds"]["navigation"]["count"] == 1
+    assert crawl["phases_seconds"]["navigation"]["max"] >= 0.01
+    assert crawl["response_chars"]["max"] == len(text)
+
+    metrics = await server.dispatch_tool("server_stats", {"format": "prometheus"})
+    assert 'cs_crawler_tool_calls_total{tool="crawl_url"} 2' in metrics
+    assert 'cs_crawler_phase_seconds_count{tool="crawl_url",phase="navigation"} 1' in metrics
+
+
+async def test_lease_waits_for_warmup_instead_of_launching(fake_crawlers):
+    """A tool call arriving during warm-up reuses the pre-launched crawler"""
+    pool = server.CrawlerPool(size=3, max_uses=10)
+    warmup = pool.start_warmup(1)
+    async with pool.lease() as crawler_instance:
+        assert warmup.done()
+        assert crawler_instance is fake_crawlers[0]
+    assert len(fake_crawlers) == 1
+
+
+async def test_lease_during_import_phase_shares_the_warm_browser(fake_crawlers, monkeypatch):
+    """A call landing while Crawl4AI imports waits for warm-up and no browser is leaked"""
+    imported = asyncio.Event()
+
+    async def slow_import():
+        await imported.wait()
+
+    monkeypatch.setattr(server, "_import_crawl4ai", slow_import)
+    pool = server.CrawlerPool(size=2, max_uses=10)
+    monkeypatch.setattr(server, "crawler_pool", pool)
+    warmup = asyncio.ensure_future(server.warm_up(browsers=1))
+    await asyncio.sleep(0)
+
+    async def call():
+        async with pool.lease() as crawler_instance:
+            return crawler_instance
+
+    lease = asyncio.ensure_future(call())
+    await asyncio.sleep(0.01)
+    assert not lease.done() and not fake_crawlers
+    imported.set()
+    assert await lease is fake_crawlers[0]
+    await warmup
+    assert len(fake_crawlers) == 1 and pool.idle_count == 2
+
+    # A slot that already holds a crawler is not overwritten by a later warm-up
+    pool._warmup = None
+    await pool.start_warmup(2)
+    await server.cleanup()
+    assert len(fake_crawlers) == 2 and all(crawler.closed for crawler in fake_crawlers)
+
+
+async def test_proxy_calls_share_one_daemon(tmp_path, monkeypatch):
+    """Two proxy sessions reach the same daemon and get their progress back"""
+    async def fake_dispatch(name, arguments, progress=None):
+        await progress(1, 2, "half")
+        return f"{name}:{arguments['url']}"
+
+    monkeypatch.setattr(server, "dispatch_tool", fake_dispatch)
+    monkeypatch.setattr(server, "EAGER_START", False)
+    socket_path = str(tmp_path / "d.sock")
+    daemon = server.CrawlerDaemon(socket_path, idle_timeout=0)
+    serving = asyncio.ensure_future(daemon.serve())
+    while not os.path.exists(socket_path):
+        await asyncio.sleep(0.01)
+
+    assert await server.CrawlerDaemon(socket_path).serve() is None
+    clients = [server.DaemonClient(socket_path) for _ in range(2)]
+    reports = []
+
+    async def progress(done, total=None, message=None):
+        reports.append((done, total, message))
+
+    texts = await asyncio.gather(
+        clients[0].call("crawl_url", {"url": "a"}, progress),
+        clients[1].call("crawl_url", {"url": "b"}),
+    )
+    assert texts == ["crawl_url:a", "crawl_url:b"]
+    assert reports == [(1, 2, "half")]
+    assert daemon.connections == 2
+    for client in clients:
+        await client.close()
+    serving.cancel()
+
+
+async def test_offload_uses_worker_processes_for_large_inputs(monkeypatch):
+    """Large inputs are converted in a worker process, small ones inline"""
+    monkeypatch.setattr(server, "WORKERS", 1)
+    try:
+        assert await server.offload(os.getpid, size=10) == os.getpid()
+        assert await server.offload(os.getpid, size=server.OFFLOAD_MIN_BYTES) != os.getpid()
+
+        html = "<html><head><title>Big</title></head><body>" + "<p>some words here</p>" * 20000 + "</body></html>"
+        page = await server.offload(server.html_to_page, "https://example.com/", html, 200, size=len(html))
+        assert page["title"] == "Big"
+        assert page["word_count"] == 60000
+    finally:
+        await server.cleanup()
+
+
+class FakeRoute:
+    """Playwright Route stand-in that records whether it was aborted"""
+
+    def __init__(self, url, resource_type, navigation=False, frame=None):
+        self.request = type("Request", (), {
+            "url": url,
+            "resource_type": resource_type,
+            "frame": frame or type("Frame", (), {"parent_frame": None})(),
+            "is_navigation_request": lambda _: navigation,
+        })()
+        self.outcome = None
+
+    async def abort(self):
+        self.outcome = "aborted"
+
+    async def continue_(self):
+        self.outcome = "continued"
+
+
+class FakePage:
+    """Playwright Page stand-in that keeps the installed route handler"""
+
+    def __init__(self):
+        self.handler = None
+
+    async def unroute(self, pattern):
+        self.handler = None
+
+    async def route(self, pattern, handler):
+        self.handler = handler
+
+
+async def test_network_profiles_block_by_type_and_tracker():
+    """Profiles abort unneeded resource types and trackers but never the page itself"""
+    ad_frame = type("Frame", (), {"parent_frame": object()})()
+    requests = {
+        "page": ("https://ads.doubleclick.net/", "document", True, None),
+        "ad_frame": ("https://ads.doubleclick.net/frame", "document", True, ad_frame),
+        "script": ("https://example.com/app.js", "script", False, None),
+        "tracker": ("https://www.google-analytics.com/a.js", "script", False, None),
+        "image": ("https://example.com/a.png", "image", False, None),
+        "font": ("https://example.com/a.woff2", "font", False, None),
+    }
+    outcomes = {}
+    for profile in server.NETWORK_PROFILES:
+        page = FakePage()
+        config = type("Config", (), {"shared_data": {"network_profile": profile}})()
+        assert await server.block_requests(page, config=config) is page
+        outcomes[profile] = {}
+        for name, args in requests.items():
+            route = FakeRoute(*args)
+            if page.handler:
+                await page.handler(route)
+            outcomes[profile][name] = route.outcome or "continued"
+
+    assert [name for name, outcome in outcomes["text-only"].items() if outcome == "aborted"] == [
+        "ad_frame", "tracker", "image", "font"]
+    assert [name for name, outcome in outcomes["text+images-metadata"].items() if outcome == "aborted"] == [
+        "ad_frame", "tracker", "font"]
+    assert set(outcomes["full"].values()) == {"continued"}
+
+
+async def test_render_deadline_fails_the_call_and_recycles_the_browser(fake_crawlers, monkeypatch):
+    """A navigation still waiting at timeout_ms is abandoned with its browser"""
+    configs = []
+
+    async def hang(self, url, config):
+        configs.append(config)
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(FakeCrawler, "arun", hang, raising=False)
+    pool = server.CrawlerPool(size=1, max_uses=10)
+    monkeypatch.setattr(server, "crawler_pool", pool)
+
+    with pytest.raises(server.CrawlError, match="within 1000 ms"):
+        await server.render_page("https://example.com/", wait_for="css:#main", timeout_ms=1000)
+    assert pool.recycled == 1 and fake_crawlers[0].closed
+    assert configs[0].page_timeout == 1000
+    assert configs[0].wait_for == "js:() => document.querySelector(\"#main\") !== null"
+    assert server.validate_wait_for("css:") and server.validate_wait_for("idle")
+    assert server.validate_wait_for("stable") is None
+
+
+async def test_expired_pages_are_revalidated_with_the_origin(tmp_path, monkeypatch, serve):
+    """Stale entries are served on 304 or an identical body and re-crawled on change"""
+    from aiohttp import web
+
+    state = {"version": "1", "etag": True}
+    requests = []
+
+    async def handle(request):
+        requests.append(request.headers.get("If-None-Match"))
+        etag = f'"v{state["version"]}"'
+        if state["etag"] and request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304)
+        body = f"<html><head><title>Status {state['version']}</title></head><body><p>{'ok ' * 100}</p></body></html>"
+        return web.Response(text=body, content_type="text/html", headers={"ETag": etag} if state["etag"] else {})
+
+    url = await serve(handle) + "/status"
+    monkeypatch.setattr(server, "recent_pages", server.RecentPages(window=0))
+    cache = server.ResponseCache(directory=str(tmp_path), ttl=0)
+    monkeypatch.setattr(server, "get_response_cache", lambda: cache)
+    first = await server.fetch_page(url, render="static")
+    assert first["validators"]["etag"] == '"v1"'
+    assert (await server.fetch_page(url, render="static"))["title"] == "Status 1"
+    assert requests == [None, '"v1"']
+
+    state["version"] = "2"
+    assert (await server.fetch_page(url, render="static"))["title"] == "Status 2"
+    assert requests[2:] == ['"v1"', None]
+
+    # Without validators from the origin, an unchanged body hash still counts
+    state["etag"] = False
+    await server.fetch_page(url, render="static", cache_mode="refresh")
+    del requests[:]
+    assert (await server.fetch_page(url, render="static"))["title"] == "Status 2"
+    assert requests == [None]
+
+
+async def test_crawl_site_follows_links_breadth_first(monkeypatch, serve):
+    """crawl_site stays in scope, honours robots.txt and stops at max_depth"""
+    from aiohttp import web
+
+    filler = "<p>" + "words " * 60 + "</p>"
+    links = {
+        "": ["/a", "/b", "/private/x", "https://elsewhere.example/", "/logo.png"],
+        "a": ["/c", "/b#top", "/"],
+        "b": [],
+        "c": ["/d"],
+        "d": [],
+    }
+
+    async def handle(request):
+        if request.path == "/robots.txt":
+            return web.Response(text="User-agent: *\nDisallow: /private/\n")
+        name = request.path.strip("/")
+        anchors = "".join(f"<a href='{href}'>{href}</a>" for href in links[name])
+        return web.Response(text=f"<html><head><title>{name or 'home'}</title></head><body>{filler}{anchors}</body></html>",
+                            content_type="text/html")
+
+    base = await serve(handle)
+    monkeypatch.setattr(server, "get_response_cache", lambda: None)
+    result = await server.crawl_site_handler({
+        "url": base + "/", "max_depth": 2, "render": "static", "per_host_delay": 0, "max_concurrency": 2,
+    })
+    payload = json.loads(result[0]["text"])
+    crawled = {item["title"]: item["depth"] for item in payload["results"]}
+    assert crawled == {"home": 0, "a": 1, "b": 1, "c": 2}
+    assert payload["summary"]["skipped_robots"] == 1
+    assert payload["summary"]["skipped_out_of_scope"] == 2
+
+    result = await server.crawl_site_handler({"url": base + "/", "max_pages": 2, "render": "static"})
+    assert json.loads(result[0]["text"])["summary"]["crawled"] == 2
+
+
+async def test_discover_urls_reads_nested_gzipped_sitemaps(monkeypatch, serve):
+    """Sitemaps are found through robots.txt, nested indexes are followed and lastmod filters"""
+    import gzip
+
+    from aiohttp import web
+
+    ns = "xmlns='http://www.sitemaps.org/schemas/sitemap/0.9'"
+    files = {}
+
+    def entries(tag, items):
+        return "".join(f"<{tag}><loc>{{base}}{loc}</loc>{f'<lastmod>{lastmod}</lastmod>' if lastmod else ''}</{tag}>"
+                       for loc, lastmod in items)
+
+    files["/index.xml"] = f"<sitemapindex {ns}>" + entries("sitemap", [
+        ("/new.xml.gz", "2024-06-01"), ("/old.xml", "2020-01-01")]) + "</sitemapindex>"
+    files["/new.xml.gz"] = f"<urlset {ns}>" + entries("url", [
+        ("/fresh", "2024-05-20T08:00:00Z"), ("/stale", "2023-01-01"), ("/undated", None)]) + "</urlset>"
+    files["/old.xml"] = f"<urlset {ns}>" + entries("url", [("/ancient", "2019-01-01")]) + "</urlset>"
+
+    async def handle(request):
+        base = f"http://{request.host}"
+        if request.path == "/robots.txt":
+            return web.Response(text=f"User-agent: *\nAllow: /\nSitemap: {base}/index.xml\n")
+        if request.path in files:
+            body = files[request.path].replace("{base}", base).encode()
+            if request.path.endswith(".gz"):
+                return web.Response(body=gzip.compress(body), content_type="application/x-gzip")
+            return web.Response(body=body, content_type="application/xml")
+        text = "<html><head><title>Fresh</title></head><body><p>" + "news " * 60 + "</p></body></html>"
+        return web.Response(text=text, content_type="text/html")
+
+    base = await serve(handle)
+    monkeypatch.setattr(server, "get_response_cache", lambda: None)
+    result = await server.discover_urls_handler({"url": base + "/"})
+    payload = json.loads(result[0]["text"])
+    assert [item["url"] for item in payload["urls"]] == [
+        base + path for path in ("/fresh", "/stale", "/undated", "/ancient")]
+    assert payload["summary"]["sitemaps_read"] == 3
+
+    result = await server.discover_urls_handler({
+        "url": base + "/index.xml", "since": "2024-01-01", "crawl": True, "render": "static"})
+    payload = json.loads(result[0]["text"])
+    assert payload["urls"] == [{"url": base + "/fresh", "lastmod": "2024-05-20T08:00:00Z"}]
+    assert payload["summary"]["sitemaps_read"] == 2
+    assert payload["summary"]["older_than_since"] == 2
+    assert payload["summary"]["without_lastmod"] == 1
+    assert payload["crawl"]["summary"]["succeeded"] == 1
+
+    # Stopping at max_urls closes the sitemap stream and its host slot right away
+    result = await server.discover_urls_handler({"url": base + "/index.xml", "max_urls": 1})
+    assert json.loads(result[0]["text"])["summary"]["truncated"] is True
+    assert not server.host_limiter._active
+
+
+async def test_metadata_robots_and_sitemap_requests_respect_host_limits(monkeypatch, serve):
+    """HEAD, robots.txt and sitemap requests take host slots and feed throttling back"""
+    from aiohttp import web
+
+    monkeypatch.setattr(server, "host_limiter", server.HostLimiter())
+    monkeypatch.setattr(server, "robots_files", {})
+    monkeypatch.setattr(server, "HOST_THROTTLED_RATE", 100.0)
+    held = []
+
+    async def handle(request):
+        held.append(sum(entry[1] for entry in server.host_limiter._active.values()))
+        return web.Response(status=429, headers={"Retry-After": "0"})
+
+    base = await serve(handle, method="*")
+    host = server.urlparse(base).netloc
+    robots = await server.fetch_robots(base + "/page")
+    assert robots.allow_all
+    assert host in server.host_limiter.snapshot()
+    with pytest.raises(server.CrawlError, match="HTTP 429"):
+        await server.fetch_head_metadata(base + "/page")
+    with pytest.raises(server.CrawlError, match="HTTP 429"):
+        async for _ in server.iter_sitemap(base + "/sitemap.xml"):
+            pass
+    assert held == [1, 1, 1, 1]
+    assert server.host_limiter.snapshot()[host]["requests_per_second"] < server.HOST_THROTTLED_RATE / 4
+
+
+async def test_crawl_changes_returns_only_changed_sections(tmp_path, monkeypatch):
+    """The first call sets a baseline; later calls report changed blocks or unchanged"""
+    versions = ["# Status\n\nAll systems go.\n\n## API\n\nFast.\n\n```\ncode\n\nblock\n```\n\n## Web\n\nUp."]
+    monkeypatch.setattr(server, "snapshot_store", server.ResponseCache(directory=str(tmp_path)))
+
+    async def fake_fetch(url, **options):
+        assert options["cache_mode"] == "refresh"
+        return make_page(url, markdown=versions[-1])
+
+    monkeypatch.setattr(server, "fetch_page", fake_fetch)
+    url = "https://status.example/"
+
+    first = json.loads((await server.crawl_changes_handler({"url": url, "output_format": "json"}))[0]["text"])
+    assert first["status"] == "new" and first["blocks"] == 7
+
+    result = await server.crawl_changes_handler({"url": url})
+    assert result[0]["text"].startswith("Unchanged since")
+
+    versions.append(versions[0].replace("Fast.", "Slow,   degraded.").replace("\n\n## Web\n\nUp.", ""))
+    report = json.loads((await server.crawl_changes_handler({"url": url, "output_format": "json"}))[0]["text"])
+    assert report["status"] == "changed"
+    assert [(change["op"], change["section"]) for change in report["changes"]] == [
+        ("changed", "## API"), ("removed", "## Web")]
+    assert report["changes"][0]["after"] == ["Slow,   degraded."]
+
+    # Whitespace-only edits are not changes
+    versions.append(versions[-1].replace("Slow,   degraded.", "Slow, degraded."))
+    assert (await server.crawl_changes_handler({"url": url}))[0]["text"].startswith("Unchanged")
+
+    # An error page is reported, not compared, and the snapshot survives it
+    async def missing_fetch(url, **options):
+        return dict(make_page(url, markdown="Not Found"), status_code=404)
+
+    monkeypatch.setattr(server, "fetch_page", missing_fetch)
+    assert "HTTP 404" in (await server.crawl_changes_handler({"url": url}))[0]["text"]
+    monkeypatch.setattr(server, "fetch_page", fake_fetch)
+    assert (await server.crawl_changes_handler({"url": url}))[0]["text"].startswith("Unchanged")
+
+
+async def test_crawl_batch_exports_gzipped_jsonl(tmp_path, monkeypatch):
+    """With export set, pages go to the file and the response holds only the summary"""
+    import gzip
+
+    async def fake_fetch(url, **options):
+        if url.endswith("/broken"):
+            raise server.CrawlError(f"Failed to crawl {url}: boom")
+        return make_page(url, markdown=f"# {url}")
+
+    monkeypatch.setattr(server, "fetch_page", fake_fetch)
+    monkeypatch.setattr(server, "EXPORT_DIR", str(tmp_path))
+    urls = ["https://a.example/1", "https://a.example/broken", "https://b.example/2"]
+    result = await server.crawl_batch_handler({"urls": urls, "per_host_delay": 0, "export": {"path": "out.jsonl.gz"}})
+    payload = json.loads(result[0]["text"])
+    assert "results" not in payload
+    assert payload["summary"] == {"total": 3, "succeeded": 2, "failed": 1}
+    assert payload["export"]["format"] == "jsonl.gz"
+    assert payload["export"]["records"] == 3
+    assert [item["url"] for item in payload["errors"]] == ["https://a.example/broken"]
+
+    with gzip.open(tmp_path / "out.jsonl.gz", "rt", encoding="utf-8") as f:
+        records = {record["url"]: record for record in map(json.loads, f)}
+    assert records["https://b.example/2"]["markdown"] == "# https://b.example/2"
+    assert records["https://b.example/2"]["timings"]["fetch_ms"] is not None
+    assert records["https://a.example/broken"]["success"] is False
+    assert os.listdir(tmp_path) == ["out.jsonl.gz"]
+
+    # Exports stay inside the export directory and do not replace files unless asked
+    for path in ("out.jsonl.gz", "../out.jsonl", str(tmp_path.parent / "out.jsonl"), "a/../../out.jsonl"):
+        result = await server.crawl_batch_handler({"urls": urls, "export": {"path": path}})
+        assert result[0]["text"].startswith("Error:")
+    result = await server.crawl_batch_handler({"urls": urls[:1], "export": {"path": "out.jsonl.gz", "overwrite": True}})
+    assert json.loads(result[0]["text"])["export"]["records"] == 1
+
+    # Concurrent exports to one path each write their own temporary file
+    first = server.ExportWriter(str(tmp_path / "same.jsonl"), "jsonl")
+    second = server.ExportWriter(str(tmp_path / "same.jsonl"), "jsonl")
+    first.write(server.export_record("https://a.example/1"))
+    second.write(server.export_record("https://a.example/2"))
+    first.close()
+    assert second.close()["records"] == 1
+    with open(tmp_path / "same.jsonl", encoding="utf-8") as f:
+        assert [json.loads(line)["url"] for line in f] == ["https://a.example/2"]
+
+
+def test_main_content_drops_boilerplate_and_fits_token_budget():
+    """content="main" keeps the article only and max_tokens drops low-priority sections"""
+    story = "<p>" + "The article text goes on, with commas, about the story itself. " * 4 + "</p>"
+    html = (
+        "<html><body><header><nav><a href='/'>Home</a><a href='/about'>About</a></nav></header>"
+        "<div id='cookie-banner'>We use cookies to improve your experience on this site.</div>"
+        f"<main><article><h1>Headline</h1>{story}<h2>Background</h2>{story}<h2>More</h2>{story}</article>"
+        "<aside class='related'><ul><li><a href='/x'>Another story you may like today</a></li></ul></aside></main>"
+        "<footer>Copyright Example Corp, all rights reserved, since forever and ever.</footer></body></html>"
+    )
+    page = server.html_to_page("https://example.com/story", html)
+    assert "cookies" in page["markdown"]
+
+    main = server.format_result(page["url"], page, "markdown", content="main")
+    assert main.startswith("# Headline")
+    assert "## More" in main
+    for boilerplate in ("cookies", "About", "Another story", "Copyright"):
+        assert boilerplate not in main
+
+    data = json.loads(server.format_result(page["url"], page, "json", content="main", max_tokens=100))
+    assert data["content"].startswith("# Headline")
+    assert server.estimate_tokens(data["content"]) <= 100
+    assert data["selection"]["sections_omitted"] == 2
+
+
+def test_text_output_and_counts_come_from_one_parse():
+    """output_format="text" returns plain text, and json shares the same counts"""
+    html = (
+        "<html><head><title>Guide</title><script>var hidden = 1;</script></head><body>"
+        "<h1>Getting <em>started</em></h1><p>Install it, <a href='/setup'>then set up</a>.</p>"
+        "<ul><li>one</li><li>two</li></ul><img src='a.png'><a href='https://other.example/'>elsewhere</a>"
+        "</body></html>"
+    )
+    page = server.html_to_page("https://example.com/guide", html)
+    assert page["outline"] == [{"level": 1, "text": "Getting started"}]
+
+    text = server.format_result(page["url"], page, "text")
+    assert text == "Getting started\n\nInstall it, then set up.\n\none\ntwo\n\nelsewhere"
+    assert "<" not in text and "hidden" not in text
+
+    metadata = json.loads(server.format_result(page["url"], page, "json"))["metadata"]
+    assert metadata == {"status_code": 200, "word_count": 10, "links_count": 2, "media_count": 1}
+
+
+def test_page_records_keep_one_copy_and_recent_pages_expire(monkeypatch):
+    """Pages hold no plain-text copy, round-trip through cache entries and leave memory when stale"""
+    page = server.html_to_page("https://example.com/", "<html><body><h1>Hi</h1><p>Hello there</p></body></html>")
+    assert "text" not in page and not hasattr(page, "__dict__")
+    assert server.format_result(page["url"], page, "text") == "Hi\n\nHello there"
+
+    record = server.PageRecord.from_dict(page.to_dict())
+    assert record["outline"] == page["outline"] and "text" not in record.to_dict()
+    assert json.loads(server.format_result(record["url"], record, "json"))["metadata"]["word_count"] == 3
+
+    clock = [0.0]
+    monkeypatch.setattr(server.time, "monotonic", lambda: clock[0])
+    recent = server.RecentPages(window=10, max_pages=64)
+    recent.put("https://example.com/a", "static", page)
+    clock[0] = 11.0
+    recent.put("https://example.com/b", "static", page)
+    assert len(recent._pages) == 1
+    assert recent.get("https://example.com/b") is page
+
+
+async def test_watchdog_kills_hung_navigations_and_enforces_limits(fake_crawlers, monkeypatch):
+    """check() closes stuck browsers, idle ones, and all of them past the memory limit"""
+    monkeypatch.setattr(server, "WATCHDOG_INTERVAL", 0)
+    monkeypatch.setattr(server, "HUNG_GRACE", 0)
+    usage = {"server_rss": 100 * 2 ** 20, "browser_rss": 0, "browser_processes": 1, "worker_rss": 0}
+    monkeypatch.setattr(server, "process_memory", lambda: dict(usage))
+    pool = server.CrawlerPool(size=2, max_uses=10)
+
+    async def stuck():
+        async with pool.lease(timeout=0) as crawler_instance:
+            while not crawler_instance.closed:
+                await asyncio.sleep(0.01)
+            raise RuntimeError("browser closed")
+
+    navigation = asyncio.ensure_future(stuck())
+    await asyncio.sleep(0.05)
+    await pool.check()
+    with pytest.raises(RuntimeError):
+        await navigation
+    assert fake_crawlers[0].closed and pool._slots[0].crawler is None
+    assert server.stats.counters["watchdog_hung_kills"] >= 1
+
+    async with pool.lease():
+        pass
+    monkeypatch.setattr(server, "BROWSER_IDLE_TIMEOUT", 1)
+    monkeypatch.setattr(server.time, "monotonic", lambda: 1e9)
+    await pool.check()
+    assert fake_crawlers[1].closed
+
+    async with pool.lease():
+        usage["browser_rss"] = server.BROWSER_MAX_BYTES + 1
+        await pool.check()
+        assert not fake_crawlers[2].closed
+    assert fake_crawlers[2].closed
+    assert pool.memory["browser_rss"] == server.BROWSER_MAX_BYTES + 1
+
+
+async def test_transient_failures_are_retried_and_throttle_the_host(monkeypatch):
+    """Resets and 503s are retried with backoff, the host slows down, other errors fail at once"""
+    monkeypatch.setattr(server, "host_limiter", server.HostLimiter())
+    monkeypatch.setattr(server, "HOST_THROTTLED_RATE", 100.0)
+    monkeypatch.setattr(server, "HOST_MAX_RATE", 1000.0)
+    attempts = {}
+
+    async def flaky_load(url, render="auto", **options):
+        attempts[url] = attempts.get(url, 0) + 1
+        if url.endswith("/reset") and attempts[url] == 1:
+            raise ConnectionResetError("Connection reset by peer")
+        if url.endswith("/busy") and attempts[url] < 3:
+            return server.PageRecord.from_dict(dict(make_page(url), status_code=503, retry_after=0.05))
+        if url.endswith("/gone"):
+            raise server.CrawlError(f"Failed to crawl {url}: unsupported content type image/png")
+        return make_page(url)
+
+    monkeypatch.setattr(server, "load_page", flaky_load)
+    monkeypatch.setattr(server, "get_response_cache", lambda: None)
+    monkeypatch.setattr(server, "recent_pages", server.RecentPages(window=0))
+    urls = ["https://a.example/reset", "https://b.example/busy", "https://c.example/gone"]
+    result = await server.crawl_batch_handler({"urls": urls, "per_host_delay": 0, "retry_backoff": 0})
+    payload = json.loads(result[0]["text"])
+    assert [item["success"] for item in payload["results"]] == [True, True, False]
+    assert attempts == {urls[0]: 2, urls[1]: 3, urls[2]: 1}
+    assert server.host_limiter.snapshot()["b.example"]["requests_per_second"] < server.HOST_MAX_RATE
+
+    attempts.clear()
+    await server.crawl_url_handler({"url": "https://b.example/busy", "retries": 1, "retry_backoff": 0})
+    assert attempts["https://b.example/busy"] == 2
+    assert server.parse_retry_after("120") == 120.0
+    assert server.is_transient(server.CrawlError("Failed to crawl x: no result within 1000 ms"))
+
+
+async def test_host_limits_are_shared_and_throttling_counts_once(monkeypatch):
+    """Every host has a process-wide concurrency limit and a shared 429 throttles it once"""
+    monkeypatch.setattr(server, "host_limiter", server.HostLimiter())
+    monkeypatch.setattr(server, "HOST_MAX_CONCURRENCY", 2)
+    active = []
+
+    async def busy():
+        async with server.host_limiter.slot("a.example"):
+            active.append(1)
+            await asyncio.sleep(0.01)
+            assert len(active) <= 2
+            active.pop()
+
+    await asyncio.gather(*(busy() for _ in range(5)))
+    assert not server.host_limiter._active
+    monkeypatch.setattr(server, "HOST_MAX_CONCURRENCY", 3)
+
+    async def throttled_load(url, render="auto", **options):
+        await asyncio.sleep(0.01)
+        return server.PageRecord.from_dict(dict(make_page(url), status_code=429))
+
+    monkeypatch.setattr(server, "load_page", throttled_load)
+    monkeypatch.setattr(server, "get_response_cache", lambda: None)
+    monkeypatch.setattr(server, "recent_pages", server.RecentPages(window=0))
+    before = server.stats.counters.get("host_throttles", 0)
+    await asyncio.gather(*(server.crawl_url_handler({"url": "https://b.example/", "retries": 0}) for _ in range(3)))
+    assert server.stats.counters["host_throttles"] == before + 1
+
+
+async def test_single_url_calls_wait_for_the_host_only_when_loading(monkeypatch):
+    """Recent and in-flight pages skip the host slots, and crawl_url has no politeness delay"""
+    loads = []
+
+    async def fake_load(url, render="auto", **options):
+        loads.append(url)
+        await asyncio.sleep(0.05)
+        return make_page(url, markdown="# Page\n\n" + "word " * 400)
+
+    monkeypatch.setattr(server, "load_page", fake_load)
+    monkeypatch.setattr(server, "get_response_cache", lambda: None)
+    monkeypatch.setattr(server, "recent_pages", server.RecentPages(window=30))
+    monkeypatch.setattr(server, "host_limiter", server.HostLimiter())
+    monkeypatch.setattr(server, "HOST_MAX_CONCURRENCY", 1)
+    started = time.monotonic()
+    await asyncio.gather(*(server.crawl_url_handler({"url": "https://a.example/"}) for _ in range(10)))
+    for offset in range(0, 2000, 500):
+        await server.crawl_url_handler({"url": "https://a.example/", "offset": offset, "max_chars": 500})
+    await asyncio.gather(*(server.crawl_url_handler({"url": f"https://a.example/{i}"}) for i in range(3)))
+    assert len(loads) == 4
+    assert time.monotonic() - started < 0.5
+
+
+async def test_retries_stay_within_timeout_ms(monkeypatch):
+    """Retries share one timeout_ms deadline and are skipped when they cannot finish in it"""
+    monkeypatch.setattr(server, "host_limiter", server.HostLimiter())
+    budgets = []
+
+    async def slow_fetch(url, timeout_ms, deadline=None, **options):
+        budgets.append(timeout_ms if deadline is None else round((deadline - time.monotonic()) * 1000))
+        await asyncio.sleep(0.2)
+        raise server.CrawlError(f"Failed to crawl {url}: no result within {timeout_ms} ms")
+
+    monkeypatch.setattr(server, "fetch_page", slow_fetch)
+    scheduler = server.HostScheduler(per_host_delay=0)
+    started = time.monotonic()
+    with pytest.raises(server.CrawlError):
+        await scheduler.fetch("https://a.example/", retries=3, backoff=0, timeout_ms=1500)
+    assert time.monotonic() - started < 1.5
+    assert len(budgets) == 3 and budgets[0] > 1450 and budgets[2] <= 1100
+
+    budgets.clear()
+    with pytest.raises(server.CrawlError):
+        await scheduler.fetch("https://b.example/", retries=3, backoff=2, timeout_ms=2000)
+    assert len(budgets) == 1